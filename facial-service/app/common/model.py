@@ -81,6 +81,20 @@ class Log:
     ex_decode_fail_img_list: list = field(default_factory=list)
     ex_image_link: str = 'none'
     ex_downloading_image_time: str = ''
+    ex_detection_cache_hit: int = 0
+    ex_detection_cache_miss: int = 0
+    ex_detection_tracked: int = 0
+    ex_detection_input_size: int = 0
+    ex_video_metadata: str = ''
+    ex_burst_num_images: int = 0
+    ex_frame_store_capacity_bytes: int = 0
+    ex_frame_store_peak_bytes: int = 0
+    ex_frame_store_num_seen: int = 0
+    ex_frame_store_num_kept: int = 0
+    ex_fas_decision_stage: dict = field(default_factory=dict)
+    ex_fas_skipped_forwards: int = 0
+    ex_num_frames_evaluated: int = 0
+    ex_frame_check_index: str = ''
     # ex_downloading_image_response: str = 'OK'
     # ex_ocr_time: str = ''
     # ex_ocr_response: str = 'OK'
@@ -35,5 +35,7 @@ AUTH_SIGNATURE_FALSE = "Invalid.Auth.Signature"
 NO_FACE = "Invalid.Face"
 DECODE_VIDEO_FALSE = "Invalid.Decode.Video"
 VIDEO_INVALID="Video.Invalid"
+VIDEO_METADATA_INVALID="Video.Metadata.Invalid"
+BURST_INVALID="Burst.Invalid"
 LACK_DATA = "Lack.Data"
 EXCEPTION_REQUEST='Exception'
@@ -1,11 +1,29 @@
+import os
 import torch
 import sys
 import time
 from app.extensions import config
+from app.gvision.num_threads import set_num_threads
+
+# before any model is loaded, so every onnxruntime session gets the limit
+set_num_threads(config.INFERENCE_NUM_THREADS)
 
 AntiSpoofClassify = None
+AntiSpoofClassifyBatched = None
 
 def getFaceDetector():
+    if config.FACE_DETECTION_BACKEND == 'onnx':
+        from app.gvision.face_detection.yolov8_onnx import Face_Landmark_ORT, export_onnx
+        if not os.path.exists(config.FACE_DETECTION_ONNX_PATH):
+            export_onnx(config.FACE_DETECTION_MODELPATH, config.FACE_DETECTION_ONNX_PATH, config.FACE_DETECTION_IMAGESIZE)
+
+        return Face_Landmark_ORT(model_dir = config.FACE_DETECTION_ONNX_PATH,
+                            device = config.FACE_DETECTION_INDEX_GPU,
+                            image_size = config.FACE_DETECTION_IMAGESIZE,
+                            conf = config.FACE_DETECTION_CONF,
+                            iou = config.FACE_DETECTION_IOU
+                            )
+
     from app.gvision.face_detection.yolov8 import Face_Landmark
 
     return Face_Landmark(model_dir = config.FACE_DETECTION_MODELPATH,
@@ -24,15 +42,26 @@ def getAntiSpoofClassifierSilent():
     model_fas_4_0 = AntiSpoofPredict(config.FAS_INDEX_GPU)
     model_fas_4_0._load_model(config.FAS_MODEL_PATH_4_0)
 
+    model_fas_2_7.use_backend(config.FAS_BACKEND, config.FAS_ONNX_CACHE_DIR, config.FAS_ONNX_PARITY_ATOL)
+    model_fas_4_0.use_backend(config.FAS_BACKEND, config.FAS_ONNX_CACHE_DIR, config.FAS_ONNX_PARITY_ATOL)
     return model_fas_2_7, model_fas_4_0
 
+def setupClassifierBackend(classifier, threshold):
+    if config.FAS_QUANTIZE_INT8 == 1:
+        classifier.use_int8(config.FAS_ONNX_CACHE_DIR, config.FAS_CALIBRATION_DIR, threshold,
+                            config.FAS_CALIBRATION_MAX_IMAGES, config.FAS_INT8_MAX_FLIP_RATE)
+    if classifier.runner is None:
+        classifier.use_backend(config.FAS_BACKEND, config.FAS_ONNX_CACHE_DIR, config.FAS_ONNX_PARITY_ATOL)
+    return classifier
+
 def getAntiSpoofClassifierFinetune():
     from app.gvision.face_anti_spoof.anti_spoof_predict import ImageClassifier
-    return ImageClassifier(model_path = config.FAS_MODEL_PATH_1_0,
+    classifier = ImageClassifier(model_path = config.FAS_MODEL_PATH_1_0,
                         arch = "resnet50",
                         num_classes = 2,
                         input_size = 224,
                         device_id  = config.FAS_INDEX_GPU)
+    return setupClassifierBackend(classifier, config.FAS_CONF_THRESHOLD)
 
 def getAntiSpoofClassifierDeepfake():
     # from app.gvision.face_anti_spoof.deep_fake_predict import DFClassifier
@@ -41,11 +70,12 @@ def getAntiSpoofClassifierDeepfake():
     #                     device_id  = config.FAS_INDEX_GPU)
 
     from app.gvision.face_anti_spoof.anti_spoof_predict import ImageClassifier
-    return ImageClassifier(model_path = config.FAS_MODEL_PATH_DEEP_FAKE,
+    classifier = ImageClassifier(model_path = config.FAS_MODEL_PATH_DEEP_FAKE,
                         arch = "resnet50",
                         num_classes = 2,
                         input_size = 224,
                         device_id  = config.FAS_INDEX_GPU)
+    return setupClassifierBackend(classifier, config.FAS_CONF_THRESHOLD_DEEPFAKE_MODEL)
 
 
 def gen_algorithm_boxgenerator():
@@ -54,7 +84,7 @@ def gen_algorithm_boxgenerator():
 
 def get_algorithm_spoofing():
     from app.controller.facial_service.algorithm import AntiSpoofClassifier
-    global AntiSpoofClassify
+    global AntiSpoofClassify, AntiSpoofClassifyBatched
     if AntiSpoofClassify is None:
         with torch.no_grad():
             FaceDetector = getFaceDetector()
@@ -66,6 +96,12 @@ def get_algorithm_spoofing():
             AntiSpoofClassifierDeepfake = getAntiSpoofClassifierDeepfake()
             AntiSpoofClassify = AntiSpoofClassifier(FaceDetector, AntiSpoofClassifierFinetune, AntiSpoofClassifierSilent_2_7, AntiSpoofClassifierSilent_4_0, AntiSpoofClassifierDeepfake)
             print("------------------------------LOAD ALL MODELS SUCCESS------------------------------------")
+    if config.BATCHING_ENABLED == 1:
+        # the video route batches per request and keeps using AntiSpoofClassify directly
+        from app.controller.facial_service.batching import BatchedAntiSpoofClassifier
+        if AntiSpoofClassifyBatched is None:
+            AntiSpoofClassifyBatched = BatchedAntiSpoofClassifier(AntiSpoofClassify, config.BATCHING_MAX_BATCH_SIZE, config.BATCHING_MAX_WAIT_US)
+        return AntiSpoofClassifyBatched
     return AntiSpoofClassify
 
 
@@ -90,12 +126,22 @@ def get_algorithm_spoofing_video():
 
 def get_feature_extractor_w600k():
     from app.gvision.feature_extraction.face_feature_extractor import FeatureExtractor
-    return FeatureExtractor(model_path=config.FEATURE_EXTRACTION_MODEL_PATH, useGpu=config.USE_GPU, index_gpu=int(config.DEVICE_GPU))
+    model_path = config.FEATURE_EXTRACTION_MODEL_PATH
+    if config.FEATURE_EXTRACTION_INT8 == 1:
+        if os.path.exists(config.FEATURE_EXTRACTION_INT8_MODEL_PATH):
+            model_path = config.FEATURE_EXTRACTION_INT8_MODEL_PATH
+        else:
+            print('>>>> FEATURE_EXTRACTION_INT8_MODEL_PATH {0} not found, use fp32 model'.format(config.FEATURE_EXTRACTION_INT8_MODEL_PATH))
+    return FeatureExtractor(model_path=model_path, useGpu=config.USE_GPU, index_gpu=int(config.DEVICE_GPU))
 
 def get_face_detector_scrfd():
     from app.gvision.face_detection.scrfd import FaceDetector
     return FaceDetector(model_path=config.FACE_DETECTION_MODEL_PATH, threshold=config.FACE_DETECTION_CONF_THRES,
-                        useGpu=config.USE_GPU, index_gpu=config.DEVICE_GPU)
+                        useGpu=config.USE_GPU, index_gpu=config.DEVICE_GPU,
+                        input_size=config.FACE_DETECTION_INPUT_SIZE,
+                        adaptive=config.FACE_DETECTION_ADAPTIVE == 1,
+                        small_input_size=config.FACE_DETECTION_SMALL_INPUT_SIZE,
+                        min_size_face=config.MIN_SIZE_FACE)
 
 
 def get_algorithm():
@@ -103,4 +149,8 @@ def get_algorithm():
     with torch.no_grad():
         feature_extractor = get_feature_extractor_w600k()
         face_detector = get_face_detector_scrfd()
+    if config.BATCHING_ENABLED == 1:
+        from app.controller.facial_service.batching import BatchedFeatureExtractor, BatchedFaceDetector
+        feature_extractor = BatchedFeatureExtractor(feature_extractor, config.BATCHING_MAX_BATCH_SIZE, config.BATCHING_MAX_WAIT_US)
+        face_detector = BatchedFaceDetector(face_detector, config.BATCHING_MAX_BATCH_SIZE, config.BATCHING_MAX_WAIT_US)
     return FaceRecognition(feature_extractor, face_detector)
\ No newline at end of file
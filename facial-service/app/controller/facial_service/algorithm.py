@@ -2,20 +2,20 @@ import random
 import time
 import mimetypes
 import cv2
-import tempfile
 import numpy as np
-import ffmpeg
 import hashlib
-import os
 import threading
-from skimage.metrics import structural_similarity
 import concurrent.futures
+from dataclasses import dataclass, field
 from app.constants import *
 from app.extensions import config
-from app.controller.facial_service.utils import img2str
+from app.controller.facial_service.utils import img2str, probe_image_size
+from app.controller.facial_service.video_decoder import VideoDecoder, VideoMetadataError
+from app.controller.facial_service.frame_store import FrameStore
+from app.controller.facial_service.frame_quality import frame_quality_scores, select_frames
 from app.gvision.face_detection import face_align
-
-cv2.setNumThreads(8)
+from app.gvision.face_detection.face_tracker import FaceTracker
+from app.gvision.face_anti_spoof.crop_preprocessor import AntiSpoofCropPreprocessor
 
 def get_diff_timestamp(tstamp1, tstamp2):
     if tstamp1 > tstamp2:
@@ -28,6 +28,91 @@ def is_video_file(file):
     mime_type, _ = mimetypes.guess_type(file.filename)
     return mime_type and mime_type.startswith('video')
 
+def _box_mean(stack, win_size):
+    # mean over every win_size x win_size window of each (h, w) image in the stack, valid region only
+    integral = np.pad(stack.cumsum(axis=1).cumsum(axis=2), ((0, 0), (1, 0), (1, 0)))
+    window_sum = integral[:, win_size:, win_size:] - integral[:, :-win_size, win_size:] \
+                 - integral[:, win_size:, :-win_size] + integral[:, :-win_size, :-win_size]
+    return window_sum / (win_size * win_size)
+
+def downscale_gray(frame, max_side, min_side=7):
+    '''
+        ảnh xám với cạnh dài <= max_side (INTER_AREA), cạnh ngắn không nhỏ hơn cửa sổ SSIM
+    '''
+    height, width = frame.shape[:2]
+    scale = min(1.0, float(max_side) / max(height, width))
+    size = (max(min_side, int(round(width * scale))), max(min_side, int(round(height * scale))))
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if size != (width, height):
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    return gray
+
+def frame_pairs_ssim(frame_list, pairs, max_side=160, win_size=7, data_range=255.0):
+    '''
+        SSIM của nhiều cặp frame (i, j) trong một lần tính numpy trên ảnh xám cạnh dài max_side
+        (cùng công thức với skimage structural_similarity mặc định: cửa sổ 7x7, sample covariance)
+        mỗi frame chỉ chuyển xám / resize một lần dù xuất hiện trong nhiều cặp
+    '''
+    if len(pairs) == 0:
+        return np.zeros(0)
+    grays = {}
+    for index in sorted(set(i for pair in pairs for i in pair)):
+        grays[index] = downscale_gray(frame_list[index], max_side, win_size).astype(np.float64)
+    first = np.stack([grays[i] for i, _ in pairs])
+    second = np.stack([grays[j] for _, j in pairs])
+
+    mu_x = _box_mean(first, win_size)
+    mu_y = _box_mean(second, win_size)
+    uxx = _box_mean(first * first, win_size)
+    uyy = _box_mean(second * second, win_size)
+    uxy = _box_mean(first * second, win_size)
+
+    num_pixels = win_size * win_size
+    cov_norm = num_pixels / (num_pixels - 1)
+    vx = cov_norm * (uxx - mu_x * mu_x)
+    vy = cov_norm * (uyy - mu_y * mu_y)
+    vxy = cov_norm * (uxy - mu_x * mu_y)
+
+    c1 = (0.01 * data_range) ** 2
+    c2 = (0.03 * data_range) ** 2
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * vxy + c2)) / ((mu_x * mu_x + mu_y * mu_y + c1) * (vx + vy + c2))
+    # skimage crops (win_size - 1) // 2 pixels on each side before averaging, the box mean is already that valid region
+    return ssim_map.mean(axis=(1, 2))
+
+def estimate_face_directions(face_kps):
+    '''
+        ước lượng hướng mặt cho N khuôn mặt cùng lúc từ keypoints (N, 5, 2): mắt phải, mắt trái, mũi
+        trả về (list hướng của từng mặt, histogram theo hướng, index mặt chính diện tốt nhất hoặc None)
+    '''
+    eye_right, eye_left, nose = face_kps[:, 0], face_kps[:, 1], face_kps[:, 2]
+
+    def angle_at(vertex, a, b):
+        va = a - vertex
+        vb = b - vertex
+        cosine_angle = np.sum(va * vb, axis=1) / (np.linalg.norm(va, axis=1) * np.linalg.norm(vb, axis=1))
+        return np.degrees(np.arccos(np.clip(cosine_angle, -1.0, 1.0)))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ang_right = angle_at(eye_left, eye_right, nose)
+        ang_left = angle_at(eye_right, eye_left, nose)
+
+    # same bounds as int(angle) in range(35, 57) / range(35, 58)
+    is_frontal = (ang_right >= 35) & (ang_right < 57) & (ang_left >= 35) & (ang_left < 58)
+    directions = np.where(is_frontal, FRONTAL_DIRECTION,
+                          np.where(ang_right < ang_left, LEFT_DIRECTION, RIGHT_DIRECTION)).tolist()
+    histogram = {
+        FRONTAL_DIRECTION: int(np.count_nonzero(is_frontal)),
+        LEFT_DIRECTION: directions.count(LEFT_DIRECTION),
+        RIGHT_DIRECTION: directions.count(RIGHT_DIRECTION),
+    }
+
+    best_frontal = None
+    if histogram[FRONTAL_DIRECTION] > 0:
+        # the most symmetric eye/nose triangle is the most frontal face
+        asymmetry = np.where(is_frontal, np.abs(ang_right - ang_left), np.inf)
+        best_frontal = int(np.argmin(asymmetry))
+    return directions, histogram, best_frontal
+
 class FaceRecognition:
     def __init__(self, feature_extractor, face_detector):
         self._feature_extractor = feature_extractor
@@ -49,10 +134,19 @@ class FaceRecognition:
         normalized_feature = self._feature_extractor(aligned_face)
         log.ex_time_extract_feature = round(time.time() - start_time_extract_feature, 3)
         return normalized_feature
+
+    def extract_features(self, aligned_faces, log):
+        '''
+            trích xuất feature cho nhiều khuôn mặt đã align trong một lần chạy model, trả về ma trận (N, 512)
+        '''
+        start_time_extract_feature = time.time()
+        normalized_features = self._feature_extractor(aligned_faces)
+        log.ex_time_extract_feature = round(time.time() - start_time_extract_feature, 3)
+        return normalized_features
     
     def detect_biggest_face(self, img, log):
         start_time_detect = time.time()
-        status, bboxes, kpss = self._face_detector(img)
+        status, bboxes, kpss = self._face_detector(img, log)
         if status == 0:
             return status, FACE_NOT_FOUND
             
@@ -71,19 +165,16 @@ class FaceRecognition:
 
     def detect_faces(self, img, log):
         start_time_detect = time.time()
-        status, bboxes, kpss = self._face_detector(img)
+        # every face is used, so adaptive detection escalates on any small face, not only the largest
+        status, bboxes, kpss = self._face_detector(img, log, all_faces=True)
         if status == 0:
             return status, FACE_NOT_FOUND
             
-        crop_faces = []
-        for i, box_item in enumerate(bboxes):
-            x1, y1, x2, y2, score = box_item
-            width = x2-x1
-            height = y2-y1
-            if width > config.MIN_SIZE_FACE and height > config.MIN_SIZE_FACE:
-                aligned_face = face_align.norm_crop(img, kpss[i])
-                crop_faces.append(aligned_face)
-       
+        width = bboxes[:, 2] - bboxes[:, 0]
+        height = bboxes[:, 3] - bboxes[:, 1]
+        is_valid_size = (width > config.MIN_SIZE_FACE) & (height > config.MIN_SIZE_FACE)
+        crop_faces = face_align.norm_crop_batch(img, kpss[is_valid_size])
+
         log.ex_time_detection = round(time.time() - start_time_detect, 3)
         return status, crop_faces
 
@@ -142,6 +233,11 @@ class RandomBoundingBoxGenerator:
 
         return result
     
+# model group that decided the label of a face (first group under its threshold, else the last group run)
+STAGE_MINIFASNET = 'minifasnet'
+STAGE_FINETUNE = 'finetune'
+STAGE_DEEPFAKE = 'deepfake'
+
 class AntiSpoofClassifier:
     def __init__(self, face_detector_, model_fas_1_0_, model_fas_2_7_, model_fas_4_0_, model_fas_deepfake_):
 
@@ -154,66 +250,147 @@ class AntiSpoofClassifier:
         self.FAS_CONF_THRESHOLD = config.FAS_CONF_THRESHOLD
         self.FAS_CONF_THRESHOLD_SUB_MODEL = config.FAS_CONF_THRESHOLD_SUB_MODEL
         self.FAS_CONF_THRESHOLD_DEEPFAKE_MODEL = config.FAS_CONF_THRESHOLD_DEEPFAKE_MODEL
+        self.cascade_mode = config.FAS_CASCADE_MODE == 1
+        self.crop_preprocessor = AntiSpoofCropPreprocessor(classifier_size=self.Model_FAS_1_0.input_size,
+                                                           mean=self.Model_FAS_1_0.MEAN, std=self.Model_FAS_1_0.STD)
 
 
-    def forward_model_silent(self, image_crop2_7, image_crop4_0):
-        prediction_output = np.zeros((1, 2))
+    def forward_model_silent(self, crops_2_7, crops_4_0):
         # 1: real ; 0: spoof
-        prediction = np.zeros((1, 3))
-        prediction += self.Model_FAS_2_7.inference(image_crop2_7)
-        # prediction += self.Model_FAS_2_7.inference(image_crop4_0)
-        prediction += self.Model_FAS_4_0.inference(image_crop4_0)
-        prediction_output[0][0], prediction_output[0][1] = prediction[0][1]/2, (prediction[0][0] +  prediction[0][2])/2
-        
-        return prediction_output[0]
+        prediction = np.zeros((len(crops_2_7), 3))
+        prediction += self.Model_FAS_2_7.inference_tensor(crops_2_7)
+        prediction += self.Model_FAS_4_0.inference_tensor(crops_4_0)
+        prediction_output = np.stack([prediction[:, 1]/2, (prediction[:, 0] + prediction[:, 2])/2], axis=1)
 
-    def forward_model_finetune(self, image, image_crop2_0):
-        result_2 = self.Model_FAS_1_0.predict(image)
-        result_2 += self.Model_FAS_1_0.predict(image_crop2_0)
-        
-        return result_2 / 2
+        return prediction_output
 
+    def forward_model_finetune(self, classifier_batch):
+        # face crops then 2.0 padding crops, both 224x224 -> share one pass
+        num_images = len(classifier_batch) // 2
+        result = self.Model_FAS_1_0.predict_tensor(classifier_batch)
 
-    def forward(self, image):
-        image_org = image
-        t_start = time.time()
-        image_bbox, image_kps = self.Face_Detector.predict(image_org)
-        print('[DETECT] time face detect = ', time.time() - t_start)
-        if image_bbox is not None:
-            image_face = self.Face_Detector.crop_image_with_padding(image_org, image_bbox, image_size = 224, padding = 0.02)
-            image_crop2_0 = self.Face_Detector.crop_image_with_padding(image_org, image_bbox, image_size = 224, padding = 0.5)
-            image_crop2_7 = self.Face_Detector.crop_image_with_padding(image_org, image_bbox, image_size = 80, padding = 0.2)
-            image_crop4_0 = self.Face_Detector.crop_image_with_padding(image_org, image_bbox, image_size = 80, padding = 0.5)
-            # print(">>>>>>> Time Detect Face : ", time.time() - t_start)
-            # cv2.imwrite('facecrop.jpg',image_face)e
-            # foward model silent pretrained
-            start_recap = time.time()
-            result_1 = self.forward_model_silent(image_crop2_7, image_crop4_0)
-            print('[DETECT] time recap pre = ', time.time() - start_recap)
-            # foward model resnet finetune
+        return (result[:num_images] + result[num_images:]) / 2
+
+    def forward_crops(self, images, bboxes):
+        '''
+            cắt crop của mọi khuôn mặt trong một lượt rồi chạy mỗi model đúng một lần trên toàn bộ crop
+            cascade mode: khuôn mặt đã dưới ngưỡng ở một nhóm model thì không chạy các nhóm ResNet50 phía sau
+            (kết quả của nhóm bị bỏ qua là NaN)
+
+            trả về result_1, result_2, result_3, stages (nhóm quyết định của từng khuôn mặt), num_skipped (số forward bỏ qua của từng khuôn mặt)
+        '''
+        classifier_batch, crops_2_7, crops_4_0 = self.crop_preprocessor(images, bboxes)
+        num_images = len(images)
+        stages = np.full(num_images, STAGE_MINIFASNET, dtype=object)
+        num_skipped = np.zeros(num_images, dtype=np.int64)
+
+        # foward model silent pretrained
+        start_recap = time.time()
+        result_1 = self.forward_model_silent(crops_2_7, crops_4_0)
+        print('[DETECT] time recap pre = ', time.time() - start_recap)
+        remain = np.arange(num_images)
+        if self.cascade_mode:
+            remain = remain[result_1[:, 0] > self.FAS_CONF_THRESHOLD_SUB_MODEL]
+        # face crop + 2.0 crop of the finetune model, + face crop of the deepfake model
+        num_skipped[np.setdiff1d(np.arange(num_images), remain)] += 3 if config.USE_DEEPFAKE_MODEL == 1 else 2
+
+        # foward model resnet finetune
+        result_2 = np.full((num_images, 2), np.nan)
+        if len(remain) > 0:
             start_recap_finetune = time.time()
-            result_2  = self.forward_model_finetune(image_face, image_crop2_0)
+            if len(remain) == num_images:
+                batch = classifier_batch
+            else:
+                batch = classifier_batch[np.concatenate([remain, remain + num_images])]
+            result_2[remain] = self.forward_model_finetune(batch)
+            stages[remain] = STAGE_FINETUNE
             print('[DETECT] time recap finetune = ', time.time() - start_recap_finetune)
-
-            result_3 = np.array([1, 0])
-            if config.USE_DEEPFAKE_MODEL == 1:
+            if self.cascade_mode:
+                passed = result_2[remain, 0] > self.FAS_CONF_THRESHOLD
+                if config.USE_DEEPFAKE_MODEL == 1:
+                    num_skipped[remain[~passed]] += 1
+                remain = remain[passed]
+
+        result_3 = np.tile(np.array([1, 0]), (num_images, 1)).astype(np.float64)
+        if config.USE_DEEPFAKE_MODEL == 1:
+            result_3[:] = np.nan
+            if len(remain) > 0:
                 # foward model resnet deepfake
                 start_df = time.time()
-                result_3  = self.Model_FAS_Deepfake.predict(image_face)
+                batch = classifier_batch[:num_images] if len(remain) == num_images else classifier_batch[remain]
+                result_3[remain] = self.Model_FAS_Deepfake.predict_tensor(batch)
+                stages[remain] = STAGE_DEEPFAKE
                 print('[DETECT] time deepfake = ', time.time() - start_df)
 
-            return result_1, result_2, result_3
+        if not self.cascade_mode:
+            # every group ran, the deciding one is the first under its threshold
+            stages[:] = STAGE_DEEPFAKE if config.USE_DEEPFAKE_MODEL == 1 else STAGE_FINETUNE
+            stages[result_3[:, 0] <= self.FAS_CONF_THRESHOLD_DEEPFAKE_MODEL] = STAGE_DEEPFAKE
+            stages[result_2[:, 0] <= self.FAS_CONF_THRESHOLD] = STAGE_FINETUNE
+            stages[result_1[:, 0] <= self.FAS_CONF_THRESHOLD_SUB_MODEL] = STAGE_MINIFASNET
+
+        return result_1, result_2, result_3, stages, num_skipped
+
+    def update_log(self, log, stages, num_skipped):
+        '''
+            cộng dồn vào log (một request video có thể gọi predict_batch nhiều lần)
+        '''
+        if log is None:
+            return
+        for stage in stages:
+            log.ex_fas_decision_stage[stage] = log.ex_fas_decision_stage.get(stage, 0) + 1
+        log.ex_fas_skipped_forwards += int(np.sum(num_skipped))
+
+    def forward(self, image, log=None):
+        image_org = image
+        t_start = time.time()
+        image_bbox, image_kps = self.Face_Detector.predict(image_org)
+        print('[DETECT] time face detect = ', time.time() - t_start)
+        if image_bbox is not None:
+            result_1, result_2, result_3, stages, num_skipped = self.forward_crops([image_org], [image_bbox])
+            self.update_log(log, stages, num_skipped)
+            return result_1[0], result_2[0], result_3[0]
         else:
             return None, None, None
 
-    def predict(self, image):
+    def forward_batch_stats(self, images, detections=None):
+        '''
+            như forward_batch nhưng trả về riêng cho từng ảnh (outputs, stage, num_skipped) thay vì ghi vào log,
+            dùng khi một batch gồm ảnh của nhiều request khác nhau; ảnh không có mặt: ((None, None, None), None, 0)
+        '''
+        if detections is None:
+            t_start = time.time()
+            detections = [self.Face_Detector.first_face(*faces) for faces in self.Face_Detector.predict_batch(images)]
+            print('[DETECT] time face detect batch = ', time.time() - t_start)
+
+        results = [((None, None, None), None, 0)] * len(images)
+        face_indexes = [i for i, (image_bbox, _) in enumerate(detections) if image_bbox is not None]
+        if len(face_indexes) == 0:
+            return results
+
+        result_1, result_2, result_3, stages, num_skipped = self.forward_crops([images[i] for i in face_indexes],
+                                                                               [detections[i][0] for i in face_indexes])
+        for k, i in enumerate(face_indexes):
+            results[i] = ((result_1[k], result_2[k], result_3[k]), stages[k], int(num_skipped[k]))
+        return results
+
+    def forward_batch(self, images, detections=None, log=None):
+        '''
+            chạy toàn bộ ảnh qua detector một lần và mỗi model anti-spoof một lần (batch N ảnh)
+            detections: (bbox, keypoints) đã có sẵn của từng ảnh, nếu truyền vào thì bỏ qua bước detect
+        '''
+        results = self.forward_batch_stats(images, detections)
+        stages = [stage for _, stage, _ in results if stage is not None]
+        self.update_log(log, stages, [num_skipped for _, _, num_skipped in results])
+        return [outputs for outputs, _, _ in results]
+
+    def build_result(self, result_model1, result_model2, result_model3):
         result = {
             "label": "",
             "score": 0,
             "error_code": "",
             "message": ""
         }
-        result_model1, result_model2, result_model3 = self.forward(image)
         print(">>> result_model1:: ", result_model1)
         print(">>> result_model2:: ", result_model2)
         print(">>> result_model3:: ", result_model3)
@@ -225,7 +402,8 @@ class AntiSpoofClassifier:
                 "message": "The face cannot be detected"
                 })
         else:
-            live_score = round((result_model2[0] + result_model1[0] + result_model3[0])/3 , 2)
+            # stages skipped by the cascade are NaN and left out of the average
+            live_score = round(float(np.nanmean([result_model2[0], result_model1[0], result_model3[0]])), 2)
             if result_model2[0] > self.FAS_CONF_THRESHOLD and result_model1[0] > self.FAS_CONF_THRESHOLD_SUB_MODEL and result_model3[0] > self.FAS_CONF_THRESHOLD_DEEPFAKE_MODEL:
                 result.update({
                                 "label": LIVE_CLASS_NAME,
@@ -238,130 +416,213 @@ class AntiSpoofClassifier:
                 })
         
         return result
+
+    def predict(self, image, log=None):
+        result_model1, result_model2, result_model3 = self.forward(image, log)
+        return self.build_result(result_model1, result_model2, result_model3)
+
+    def predict_batch(self, images, detections=None, log=None):
+        return [self.build_result(*outputs) for outputs in self.forward_batch(images, detections, log)]
     
+class FrameDetectionCache:
+    '''
+        lưu kết quả detect (bbox, keypoints) của từng frame trong một request,
+        mỗi frame chỉ detect đúng một lần và dùng chung cho các bước check area, pose, anti-spoof
+
+        khi có tracker (VIDEO_TRACKING=1): lần đầu cần toàn bộ frame thì detect frame đầu và mỗi N frame,
+        các frame còn lại lấy bbox/keypoints từ optical flow; get_many(..., exact=True) detect lại
+        các frame đang là kết quả tracking (frame chạy anti-spoof cần bbox chính xác)
+    '''
+    def __init__(self, face_detector, frames, batch_size=16, tracker=None):
+        self.face_detector = face_detector
+        self.frames = frames
+        self.batch_size = max(1, batch_size)
+        self.tracker = tracker
+        self.num_hit = 0
+        self.num_miss = 0
+        self.num_tracked = 0
+        self._results = {}
+        self._pending = {}
+        self._tracked = set()
+        self._track_done = None
+        self._lock = threading.Lock()
+
+    def get(self, index):
+        return self.get_many([index])[0]
+
+    def track_all(self):
+        '''
+            chạy tracker một lần cho cả video, các lần gọi sau (hoặc gọi đồng thời) chờ kết quả lần đầu
+        '''
+        with self._lock:
+            track_done = self._track_done
+            if track_done is None:
+                self._track_done = threading.Event()
+        if track_done is not None:
+            track_done.wait()
+            return
+
+        detections, is_detected = [], []
+        try:
+            detections, is_detected = self.tracker.track(self.frames)
+        finally:
+            with self._lock:
+                for index, detection in enumerate(detections):
+                    # a frame detected exactly in the meantime keeps the detector result
+                    if index in self._results or index in self._pending:
+                        continue
+                    self._results[index] = detection
+                    if is_detected[index]:
+                        self.num_miss += 1
+                    else:
+                        self.num_tracked += 1
+                        self._tracked.add(index)
+                self._track_done.set()
+
+    def get_many(self, indexes, exact=False):
+        indexes = list(indexes)
+        use_tracking = self.tracker is not None and not exact
+        if use_tracking:
+            self.track_all()
+
+        to_detect = []
+        waiting = []
+        with self._lock:
+            for index in indexes:
+                if index in self._results and (use_tracking or index not in self._tracked):
+                    self.num_hit += 1
+                elif index in self._pending:
+                    # another stage is already detecting this frame
+                    self.num_hit += 1
+                    waiting.append(self._pending[index])
+                else:
+                    self.num_miss += 1
+                    self._tracked.discard(index)
+                    self._pending[index] = threading.Event()
+                    to_detect.append(index)
+
+        for i in range(0, len(to_detect), self.batch_size):
+            chunk = to_detect[i:i + self.batch_size]
+            detections = [(None, None)] * len(chunk)
+            try:
+                detections = [self.face_detector.first_face(*faces)
+                              for faces in self.face_detector.predict_batch([self.frames[index] for index in chunk], select_largest=True)]
+            finally:
+                with self._lock:
+                    for index, detection in zip(chunk, detections):
+                        self._results[index] = detection
+                        self._pending.pop(index).set()
+
+        for event in waiting:
+            event.wait()
+        return [self._results[index] for index in indexes]
+
+    def update_log(self, log):
+        log.ex_detection_cache_hit = self.num_hit
+        log.ex_detection_cache_miss = self.num_miss
+        log.ex_detection_tracked = self.num_tracked
+
+
+@dataclass
+class VideoRequestContext:
+    '''
+        toàn bộ trạng thái của một request video, mỗi request có context riêng
+        nên DetectSpoofVideo (singleton) có thể xử lý nhiều request cùng lúc
+    '''
+    frames: list
+    detection_cache: FrameDetectionCache
+    # result anti-spoof per frame
+    result_frame_status: list = field(default_factory=list)
+    result_frame_score: list = field(default_factory=list)
+    num_frames_total: int = 0
+    # frames classified by the anti-spoof ensemble, quality of every frame (quality selection only)
+    index_check: list = field(default_factory=list)
+    frame_quality: object = None
+    # check face area
+    ratio_face_area_to_frame: float = 0.0
+    # result check similarity image
+    is_similarity_images_valid: bool = False
+    similarity_images_result: list = field(default_factory=list)
+    # result check face direction
+    result_face_direction: list = field(default_factory=list)
+    is_enough_direction_face: bool = False
+    frontal_face_image: object = None
+
+
 class DetectSpoofVideo:
     def __init__(self, anti_spoof_classifier, face_detector):
         self.anti_spoof_classifier = anti_spoof_classifier
         self.face_detector = face_detector
-        self.result_frame_status = []
-        self.result_frame_score = []
-
-        # check face area
-        self.ratio_face_area_to_frame = 0.0
-
-        # result check similarity image
-        self.is_similarity_images_valid = False
-        self.similarity_images_result = []
-
-        # result check face direction
-        self.result_face_direction = []
-        self.is_enough_direction_face = False
-        self.frontal_face_image = None
+        self.face_tracker = None
+        if config.VIDEO_TRACKING == 1:
+            self.face_tracker = FaceTracker(face_detector, redetect_interval=config.VIDEO_TRACKING_DETECT_INTERVAL,
+                                            max_side=config.VIDEO_TRACKING_MAX_SIDE,
+                                            min_confidence=config.VIDEO_TRACKING_MIN_CONFIDENCE,
+                                            batch_size=config.FACE_DETECTION_BATCH_SIZE)
+        self.video_decoder = VideoDecoder(max_duration=config.VIDEO_MAX_DURATION,
+                                        max_resolution=config.VIDEO_MAX_RESOLUTION,
+                                        allowed_codecs=config.VIDEO_ALLOWED_CODECS,
+                                        max_side=config.VIDEO_DECODE_MAX_SIDE,
+                                        mode=config.VIDEO_DECODE_MODE,
+                                        grid_interval=config.VIDEO_DECODE_GRID_INTERVAL)
     
-    def resize_image_to_640(self, image):
-        w = image.shape[1]
-        h = image.shape[0]
-        scale = 1.0
-        target_size = 640
-        if w > h:
-            scale = target_size/w
-            w = target_size
-            h = h * scale
-        else:
-            scale = target_size/h
-            h = target_size
-            w = w * scale
-        image = cv2.resize(image, (int(w), int(h)))
-        return image
-
-
-    def check_similarity_images(self, frame_list):
+    def check_similarity_images(self, ctx):
         '''
             kiểm tra video được tao ra từ một ảnh tĩnh
+            SSIM của tất cả các cặp frame liên tiếp ở cạnh dài SIMILARITY_CHECK_MAX_SIDE, tính trong một lần (không random)
+            ngưỡng THRESHOLD_*_FRAME_SIMILARITY được chỉnh cho độ phân giải thấp: nhiễu nén gần như biến mất nên
+            frame của ảnh tĩnh cho SSIM ~0.99+, frame liên tiếp của video thật thấp hơn rõ
         '''
         start_time = time.time()
-        self.is_similarity_images_valid = False
-        self.similarity_images_result = []
-
-        for _ in range(config.NUMBER_CHECK_DUPLICATE):
-            pair_frames = random.sample(frame_list, 2)
-            if pair_frames[0].shape[0] == pair_frames[1].shape[0] and pair_frames[0].shape[1] == pair_frames[1].shape[1]:
-                first_img = self.resize_image_to_640(pair_frames[0])
-                second_img = self.resize_image_to_640(pair_frames[1])
-                first_gray = cv2.cvtColor(first_img, cv2.COLOR_BGR2GRAY)
-                second_gray = cv2.cvtColor(second_img, cv2.COLOR_BGR2GRAY)
-                score, diff = structural_similarity(first_gray, second_gray, full=True)
-                # print('>>> [check similarity images] score similarity = ', score)
-                if score > config.THRESHOLD_DUPLICATE_IMAGE_SIMILARITY:
-                    self.similarity_images_result.append(DUPLICATE_IMAGE)
-                elif score < config.THRESHOLD_DIFFERENT_IMAGE_SIMILARITY:
-                    self.similarity_images_result.append(DIFFERENT_IMAGE)
+        frame_list = ctx.frames
+
+        if any(frame.shape[:2] != frame_list[0].shape[:2] for frame in frame_list):
+            ctx.similarity_images_result.append(INVALID_IMG_SIZE) # pragma: no cover
+        else:
+            pairs = [(i, i + 1) for i in range(len(frame_list) - 1)]
+            for score in frame_pairs_ssim(frame_list, pairs, config.SIMILARITY_CHECK_MAX_SIDE):
+                if score > config.THRESHOLD_DUPLICATE_FRAME_SIMILARITY:
+                    ctx.similarity_images_result.append(DUPLICATE_IMAGE)
+                elif score < config.THRESHOLD_DIFFERENT_FRAME_SIMILARITY:
+                    ctx.similarity_images_result.append(DIFFERENT_IMAGE)
                 else:
-                    self.similarity_images_result.append(TRUE_IMAGE)
-            else:
-                # print('>>> [check duplicate images] invalid image size') # pragma: no cover
-                self.similarity_images_result.append(INVALID_IMG_SIZE) # pragma: no cover
-                break # pragma: no cover
-        if INVALID_IMG_SIZE not in self.similarity_images_result and \
-            len(self.similarity_images_result) == config.NUMBER_CHECK_DUPLICATE:
-            
-            total_frame_true_image = self.similarity_images_result.count(TRUE_IMAGE)
-            if total_frame_true_image >= (0.5 * len(self.similarity_images_result)):
-                self.is_similarity_images_valid = True
+                    ctx.similarity_images_result.append(TRUE_IMAGE)
+
+        if INVALID_IMG_SIZE not in ctx.similarity_images_result and len(ctx.similarity_images_result) > 0:
+            total_frame_true_image = ctx.similarity_images_result.count(TRUE_IMAGE)
+            if total_frame_true_image >= (0.5 * len(ctx.similarity_images_result)):
+                ctx.is_similarity_images_valid = True
         print('[IMAGE DUPLICATE] time check image duplicate = ', time.time() - start_time)
     
-    def calculate_angle(self, a, b, c):
-        ba = a - b
-        bc = c - b 
-        cosine_angle = np.dot(ba, bc)/(np.linalg.norm(ba)*np.linalg.norm(bc))
-        angle = np.arccos(cosine_angle)
-        return np.degrees(angle)
-    
-    def check_face_direction(self, frame_list):
+    def check_face_direction(self, ctx):
         '''
             kiểm tra hướng của khuôn mặt
         '''
         start_time = time.time()
-        self.result_face_direction = []
-        self.is_enough_direction_face = False
-        self.frontal_face_image = None
-
-        for frame in frame_list:
-            start_time = time.time()
-            _, face_kps = self.face_detector.predict(frame)
-            ang_right = self.calculate_angle(face_kps[0], face_kps[1], face_kps[2])
-            ang_left = self.calculate_angle(face_kps[1], face_kps[0], face_kps[2])
-            if ((int(ang_right) in range(35, 57)) and (int(ang_left) in range(35, 58))):
-                pred_direction = FRONTAL_DIRECTION
-                self.frontal_face_image = frame
-            else: 
-                if ang_right < ang_left:
-                    pred_direction = LEFT_DIRECTION
-                else:
-                    pred_direction = RIGHT_DIRECTION
-            self.result_face_direction.append(pred_direction)
-            # print('pred_direction = ', pred_direction)
-            # print('time check direct = ', time.time() - start_time)
-        
-        total_frame_frontal_direction = self.result_face_direction.count(FRONTAL_DIRECTION)
-        total_frame_left_direction = self.result_face_direction.count(LEFT_DIRECTION)
-        total_frame_right_direction = self.result_face_direction.count(RIGHT_DIRECTION)
-
-        if total_frame_frontal_direction > 0 and total_frame_left_direction > 0 and total_frame_right_direction > 0:
-            self.is_enough_direction_face = True
+        frame_list = ctx.frames
+
+        detections = ctx.detection_cache.get_many(range(len(frame_list)))
+        face_indexes = [i for i, (_, face_kps) in enumerate(detections) if face_kps is not None]
+        if len(face_indexes) > 0:
+            face_kps = np.stack([np.asarray(detections[i][1], dtype=np.float32) for i in face_indexes])
+            directions, histogram, best_frontal = estimate_face_directions(face_kps)
+            ctx.result_face_direction = directions
+            if best_frontal is not None:
+                ctx.frontal_face_image = frame_list[face_indexes[best_frontal]]
+
+            if histogram[FRONTAL_DIRECTION] > 0 and histogram[LEFT_DIRECTION] > 0 and histogram[RIGHT_DIRECTION] > 0:
+                ctx.is_enough_direction_face = True
         print('[FACE DIRECTION] time check direction = ', time.time() - start_time)
     
-    def check_face_area(self, frame_list):
+    def check_face_area(self, ctx):
         '''
             tính tỷ lệ diện tích khuôn mặt trên khung hình
         '''
-        self.ratio_face_area_to_frame = 0
-
         start_time = time.time()
+        frame_list = ctx.frames
         frame_area = frame_list[0].shape[0] * frame_list[0].shape[1]
         list_ratio_area = []
-        for frame in frame_list:
-            face_bboxes, _ = self.face_detector.predict(frame)
+        for face_bboxes, _ in ctx.detection_cache.get_many(range(len(frame_list))):
             if face_bboxes is not None:
                 [x1, y1, x2, y2] = face_bboxes
                 w_box = x2 - x1
@@ -371,52 +632,93 @@ class DetectSpoofVideo:
                 list_ratio_area.append(ratio_area)
         # print('[FACE AREA] list_ratio_area = ', list_ratio_area)
         print('[FACE AREA] time check face area = ', time.time() - start_time)
-        self.ratio_face_area_to_frame = np.mean(list_ratio_area)
-        # print('FACE AREA: ',self.ratio_face_area_to_frame)
-    def detect_spoofing(self, frame_list_check):
+        ctx.ratio_face_area_to_frame = np.mean(list_ratio_area)
+        # print('FACE AREA: ',ctx.ratio_face_area_to_frame)
+    def select_frames_check(self, ctx, num_frame_check, is_pose_check):
+        '''
+            chọn frame để chạy anti-spoof theo chất lượng (nét, đủ sáng, mặt lớn) thay vì random,
+            khi is_pose_check thì có đủ frame của các hướng mặt cần kiểm tra
+        '''
         start_time = time.time()
-        for frame in frame_list_check:
-            rs_check = self.anti_spoof_classifier.predict(frame)
-            self.result_frame_status.append(rs_check["label"])
-            self.result_frame_score.append(rs_check["score"])
-        print('[DETECT SPOOFING] time detect = ', time.time() - start_time)
-
-    def decode_video(self, video_content, frame_skip=10):
-        t_start = time.time()
-        frames = []
-        print("Start decoding video")
+        detections = ctx.detection_cache.get_many(range(len(ctx.frames)))
+        ctx.frame_quality, _ = frame_quality_scores(ctx.frames, detections, config.FRAME_QUALITY_MAX_SIDE)
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_video:
-            temp_video.write(video_content)
-            temp_video_path = temp_video.name
-
-        try:
-            metadata = ffmpeg.probe(temp_video_path)
-        except ffmpeg.Error as e:
-            print("ffprobe error:", e.stderr.decode())
-            raise ValueError("Error extracting metadata from video.")
-
-        video_capture = cv2.VideoCapture(temp_video_path)
-
-        if not video_capture.isOpened():
-            raise ValueError("Error opening video stream or file")
+        directions = None
+        if is_pose_check:
+            directions = [None] * len(ctx.frames)
+            face_indexes = [i for i, (_, face_kps) in enumerate(detections) if face_kps is not None]
+            if len(face_indexes) > 0:
+                face_kps = np.stack([np.asarray(detections[i][1], dtype=np.float32) for i in face_indexes])
+                for i, direction in zip(face_indexes, estimate_face_directions(face_kps)[0]):
+                    directions[i] = direction
+        index_check = select_frames(ctx.frame_quality, num_frame_check, directions,
+                                    (FRONTAL_DIRECTION, LEFT_DIRECTION, RIGHT_DIRECTION))
+        print('[FRAME SELECTION] time select frames = ', time.time() - start_time)
+        return index_check
+
+    def detect_spoofing(self, ctx, index_check, log=None, is_pose_check=0):
+        '''
+            index_check = None: chọn frame theo chất lượng (FRAME_SELECTION_MODE=quality)
+        '''
+        start_time = time.time()
+        if index_check is None:
+            index_check = self.select_frames_check(ctx, min(config.NUM_FRAME_CHECK, len(ctx.frames)), is_pose_check)
+        ctx.index_check = list(index_check)
+        ctx.num_frames_total = len(index_check)
+        detections = ctx.detection_cache.get_many(index_check, exact=True)
+        if config.VOTE_EARLY_STOP == 1:
+            self.detect_spoofing_early_stop(ctx, index_check, detections, log)
+        else:
+            frame_list_check = [ctx.frames[i] for i in index_check]
+            for rs_check in self.anti_spoof_classifier.predict_batch(frame_list_check, detections, log):
+                ctx.result_frame_status.append(rs_check["label"])
+                ctx.result_frame_score.append(rs_check["score"])
+        if log is not None:
+            log.ex_num_frames_evaluated = sum(1 for status in ctx.result_frame_status if status is not None)
+        print('[DETECT SPOOFING] time detect = ', time.time() - start_time)
 
-        frame_count = 0
-        while True:
-            ret, frame = video_capture.read()
-            if not ret:
+    def detect_spoofing_early_stop(self, ctx, index_check, detections, log=None):
+        '''
+            vote dạng streaming: chạy từng nhóm VOTE_CHUNK_SIZE frame, frame không có mặt (phiếu spoof, không tốn model)
+            rồi tới frame có mặt lớn nhất trước; dừng khi kết quả vote không thể đổi với số frame còn lại:
+                live / N > VOTE_THRESHOLD               -> chắc chắn LIVE
+                (live + còn lại) / N <= VOTE_THRESHOLD  -> chắc chắn SPOOF
+            N luôn là tổng số frame cần check, giống vote đầy đủ
+            kết quả được ghi theo vị trí: phần tử k là của frame index_check[k], frame không được chạy là None
+        '''
+        num_frames = len(index_check)
+        ctx.result_frame_status = [None] * num_frames
+        ctx.result_frame_score = [None] * num_frames
+
+        def informativeness(k):
+            bbox = detections[k][0]
+            if bbox is None:
+                return (0, 0)
+            if ctx.frame_quality is not None:
+                return (1, -ctx.frame_quality[index_check[k]])
+            return (1, -(bbox[2] - bbox[0]) * (bbox[3] - bbox[1]))
+        order = sorted(range(num_frames), key=informativeness)
+
+        num_live = 0
+        num_evaluated = 0
+        chunk_size = max(1, config.VOTE_CHUNK_SIZE)
+        for start in range(0, num_frames, chunk_size):
+            chunk = order[start:start + chunk_size]
+            results = self.anti_spoof_classifier.predict_batch([ctx.frames[index_check[k]] for k in chunk],
+                                                               [detections[k] for k in chunk], log)
+            for k, rs_check in zip(chunk, results):
+                ctx.result_frame_status[k] = rs_check["label"]
+                ctx.result_frame_score[k] = rs_check["score"]
+                num_live += rs_check["label"] == LIVE_CLASS_NAME
+            num_evaluated += len(chunk)
+
+            num_remain = num_frames - num_evaluated
+            if num_live / num_frames > config.VOTE_THRESHOLD or (num_live + num_remain) / num_frames <= config.VOTE_THRESHOLD:
                 break
 
-            if frame_count % frame_skip == 0:
-                frames.append(frame)
-
-            frame_count += 1
-
-        video_capture.release()
-        os.remove(temp_video_path)
-
-        print(f"Time to extract video: {time.time() - t_start:.2f} seconds, Number of frames: {len(frames)}")
-        return frames
+    def decode_video(self, video_content, frame_skip=10, frame_store=None):
+        print("Start decoding video")
+        return self.video_decoder.decode(video_content, frame_skip=frame_skip, frame_store=frame_store)
 
 
     # def predict(self, video, timestamp, unique_device_id, x_signature, log, result, is_test, is_pose_check):
@@ -424,49 +726,123 @@ class DetectSpoofVideo:
 
         t_start = time.time()
         video_content = video.read()
-        self.result_frame_status = []
-        self.result_frame_score = []
 
         log.ex_time_authen_signature = time.time() - t_start
 
+        image_upload = None
+        frame_upload = None
+
         t_start_decode = time.time()
-        frames_list = self.decode_video(video_content, frame_skip=config.SKIP_FRAME)
+        frame_store = FrameStore(max_bytes=config.VIDEO_FRAME_STORE_MAX_BYTES)
+        try:
+            video_metadata, frames_list = self.decode_video(video_content, frame_skip=config.SKIP_FRAME, frame_store=frame_store)
+        except VideoMetadataError as e:
+            result.update({
+                "error_code": VIDEO_METADATA_INVALID,
+                "message": str(e)
+            })
+            return result, image_upload, frame_upload
         log.ex_time_videodecode = time.time() - t_start_decode
+        log.ex_video_metadata = str(video_metadata)
+        frame_store.update_log(log)
+        return self.predict_frames(frames_list, log, result, is_pose_check)
+
+    def decode_burst(self, images):
+        '''
+            giải mã burst ảnh tĩnh (JPEG/PNG bytes) thành frame BGR, resize về cùng working size với video decoder
+            kích thước (bytes, độ phân giải từ header) được kiểm tra trước khi decode để ảnh quá lớn không chiếm hết RAM
+            trả về (frames, message lỗi hoặc '')
+        '''
+        for i, image in enumerate(images):
+            if len(image) > config.BURST_MAX_IMAGE_BYTES:
+                return [], "image {0} exceeds {1} bytes".format(i, config.BURST_MAX_IMAGE_BYTES)
+            image_size = probe_image_size(image)
+            if image_size is None:
+                return [], "image {0} is not a JPEG or PNG image".format(i)
+            width, height = image_size
+            if width <= 0 or height <= 0 or (self.video_decoder.max_resolution > 0 and max(width, height) > self.video_decoder.max_resolution):
+                return [], "image {0} resolution {1}x{2} exceeds {3}".format(i, width, height, self.video_decoder.max_resolution)
 
-        # print(f"video_metadata: {video_metadata}")
+        frames = []
+        for i, image in enumerate(images):
+            width, height = probe_image_size(image)
+            # let libjpeg decode at 1/2, 1/4 or 1/8 scale when the frame is resized below that anyway
+            flag = cv2.IMREAD_COLOR
+            working_width, working_height = self.video_decoder.working_size(width, height)
+            for factor, reduced_flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+                if max(width, height) // factor >= max(working_width, working_height):
+                    flag = reduced_flag
+                    break
+            frame = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), flag)
+            if frame is None:
+                return [], "image {0} cannot be decoded".format(i)
+            height, width = frame.shape[:2]
+            working_size = self.video_decoder.working_size(width, height)
+            if working_size != (width, height):
+                frame = cv2.resize(frame, working_size, interpolation=cv2.INTER_AREA)
+            frames.append(frame)
+        if len(set(frame.shape for frame in frames)) > 1:
+            return [], "images in a burst must have the same size"
+        return frames, ''
+
+    def predict_burst(self, images, log, result, is_pose_check):
+        '''
+            liveness trên một burst vài ảnh tĩnh do app chụp liên tiếp (thay cho upload video):
+            bỏ qua bước decode video, chạy cùng các bước similarity, face area, pose và vote như predict
+        '''
+        t_start_decode = time.time()
+        frames_list, message = self.decode_burst(images)
+        log.ex_time_videodecode = time.time() - t_start_decode
+        if message != '':
+            result.update({
+                "error_code": BURST_INVALID,
+                "message": message
+            })
+            return result, None, None
+        # a handful of stills is cheaper to detect one by one than to track
+        return self.predict_frames(frames_list, log, result, is_pose_check, use_tracking=False)
 
+    def predict_frames(self, frames_list, log, result, is_pose_check, use_tracking=True):
+        '''
+            các bước kiểm tra liveness trên list frame đã decode, dùng chung cho video và burst ảnh
+        '''
         image_upload = None
         frame_upload = None
 
         t_start_model = time.time()
         if len(frames_list) > 1:
-                frame_upload = frames_list
-                print('FRAME UPLOAD: ', frame_upload[0].shape, frame_upload[1].shape)
-                print("LEN UPLOAD: ", len(frame_upload))
-                cv2.imwrite('img_test.jpg', frames_list[0])
-                
-                num_frame_check = min(config.NUM_FRAME_CHECK, len(frames_list))
-                frame_list_check = random.sample(frames_list, num_frame_check)
-                frame_upload = frame_list_check
-                print('FRAME UPLOAD: ', frame_upload[0].shape, frame_upload[1].shape)
-                print("LEN UPLOAD: ", len(frame_upload))
+                face_tracker = self.face_tracker if use_tracking else None
+                ctx = VideoRequestContext(frames=frames_list,
+                                          detection_cache=FrameDetectionCache(self.face_detector, frames_list, config.FACE_DETECTION_BATCH_SIZE,
+                                                                              face_tracker))
+
+                index_check = None
+                if config.FRAME_SELECTION_MODE == 'random':
+                    num_frame_check = min(config.NUM_FRAME_CHECK, len(frames_list))
+                    index_check = random.sample(range(len(frames_list)), num_frame_check)
                 
                 if is_pose_check:
-                    thread_check_face_direction= threading.Thread(target=self.check_face_direction, args=(frames_list,))
+                    thread_check_face_direction= threading.Thread(target=self.check_face_direction, args=(ctx,))
                     thread_check_face_direction.start()
 
-                thread_check_face_area = threading.Thread(target=self.check_face_area, args=(frames_list,))
-                thread_check_similarity_images = threading.Thread(target=self.check_similarity_images, args=(frames_list,))
-                thread_detect_spooding = threading.Thread(target=self.detect_spoofing, args=(frame_list_check, ))
+                thread_check_face_area = threading.Thread(target=self.check_face_area, args=(ctx,))
+                thread_check_similarity_images = threading.Thread(target=self.check_similarity_images, args=(ctx,))
+                thread_detect_spooding = threading.Thread(target=self.detect_spoofing, args=(ctx, index_check, log, is_pose_check))
+                thread_detect_spooding.start()
                 thread_check_similarity_images.start()
                 thread_check_face_area.start()
-                thread_detect_spooding.start()
 
                 if is_pose_check:
                     thread_check_face_direction.join()
                 thread_check_similarity_images.join()
                 thread_check_face_area.join()   
                 thread_detect_spooding.join()
+                ctx.detection_cache.update_log(log)
+
+                frame_upload = [frames_list[i] for i in ctx.index_check]
+                print('FRAME UPLOAD: ', frame_upload[0].shape, frame_upload[-1].shape)
+                print("LEN UPLOAD: ", len(frame_upload))
+                log.ex_frame_check_index = str(ctx.index_check)
 
         else:
                 result.update({
@@ -475,9 +851,9 @@ class DetectSpoofVideo:
                 })
                 return result, image_upload, frame_upload
             
-        log.ex_result_frame_status = str(self.result_frame_status)
-        log.ex_result_frame_score = str(self.result_frame_score)
-        image_upload = self.frontal_face_image if self.frontal_face_image is not None else frames_list[0] # pragma: no cover
+        log.ex_result_frame_status = str(ctx.result_frame_status)
+        log.ex_result_frame_score = str(ctx.result_frame_score)
+        image_upload = ctx.frontal_face_image if ctx.frontal_face_image is not None else frames_list[0] # pragma: no cover
 
         if is_pose_check:
             face_area_threshold = config.FACE_AREA_THRESHOLD_POSE
@@ -486,40 +862,43 @@ class DetectSpoofVideo:
 
         # print('FACE_AREA_THRESHOLD: ',face_area_threshold)
         # print('IS POSE CHECK: ',is_pose_check)
-        if self.is_similarity_images_valid == False:
+        if ctx.is_similarity_images_valid == False:
             result.update({
                 'label': SPOOF_CLASS_NAME,
                 'score': 1.0
             })
-        elif self.ratio_face_area_to_frame < face_area_threshold:
+        elif ctx.ratio_face_area_to_frame < face_area_threshold:
             result.update({
                 "error_code": FACE_TOO_FAR,
                 "message": "face is too far away"
             })
-        elif self.is_enough_direction_face == False and is_pose_check == 1: # pragma: no cover
+        elif ctx.is_enough_direction_face == False and is_pose_check == 1: # pragma: no cover
             result.update({
                 "error_code": NOT_ENOUGH_FACE_DIRECTION,
                 "message": "not enough face direction"
             }) # pragma: no cover
         else:
-            total_frame_is_live = self.result_frame_status.count(LIVE_CLASS_NAME) # pragma: no cover 
-            if (total_frame_is_live / len(self.result_frame_status)) > config.VOTE_THRESHOLD: # pragma: no cover
+            total_frame_is_live = ctx.result_frame_status.count(LIVE_CLASS_NAME) # pragma: no cover 
+            # early stop leaves frames unevaluated (None), the vote is still over every frame to check
+            total_frame = max(len(ctx.result_frame_status), ctx.num_frames_total)
+            frame_scores = [score for score in ctx.result_frame_score if score is not None]
+            if (total_frame_is_live / total_frame) > config.VOTE_THRESHOLD: # pragma: no cover
                 result.update({
                     'label': LIVE_CLASS_NAME,
-                    'score': np.mean(self.result_frame_score)
+                    'score': np.mean(frame_scores)
                 }) # pragma: no cover
             else:
                 result.update({
                     'label': SPOOF_CLASS_NAME,
-                    'score': np.mean(self.result_frame_score)
+                    'score': np.mean(frame_scores)
                 }) # pragma: no cover
 
         log.ex_time_modelpredict = time.time() - t_start_model
-        log.ex_similarity_images_result = str(self.similarity_images_result)
-        log.ex_is_similarity_images_valid = 1 if self.is_similarity_images_valid else 0
-        log.ex_result_face_direction = str(self.result_face_direction)
-        log.ex_is_enough_face_direction = 1 if self.is_enough_direction_face == True else 0
-        log.ex_ratio_face_area_to_frame = self.ratio_face_area_to_frame
+        log.ex_similarity_images_result = str(ctx.similarity_images_result)
+        log.ex_is_similarity_images_valid = 1 if ctx.is_similarity_images_valid else 0
+        log.ex_result_face_direction = str(ctx.result_face_direction)
+        log.ex_is_enough_face_direction = 1 if ctx.is_enough_direction_face == True else 0
+        log.ex_ratio_face_area_to_frame = ctx.ratio_face_area_to_frame
         print("=" * 50)
 
         return result, image_upload, frame_upload
\ No newline at end of file
@@ -0,0 +1,186 @@
+import time
+import queue
+import threading
+import concurrent.futures
+import numpy as np
+
+# every MicroBatcher of the process, by name, for the stats endpoint
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+class MicroBatcher:
+    '''
+        gom các request đồng thời tới cùng một model thành một batch:
+            - mỗi request là một item trong queue riêng của model, submit trả về Future
+            - worker thread lấy item đầu tiên rồi gom thêm tới khi đủ max_batch_size
+              hoặc item cũ nhất đã chờ quá max_wait_us micro giây
+            - chạy batch_fn(list item) -> list kết quả (cùng thứ tự) một lần và trả kết quả cho từng Future
+        nếu batch_fn lỗi, batch được chia đôi và chạy lại để chỉ request gây lỗi nhận exception
+    '''
+    def __init__(self, name, batch_fn, max_batch_size=8, max_wait_us=2000):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_us = max(0, max_wait_us)
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.num_requests = 0
+        self.num_batches = 0
+        self.num_errors = 0
+        self.num_failed_batches = 0
+        self.max_queue_depth = 0
+        self.batch_size_histogram = {}
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.total_batch_time = 0.0
+
+        self._worker = threading.Thread(target=self._run, name='batcher-{0}'.format(name), daemon=True)
+        self._worker.start()
+        with _batchers_lock:
+            _batchers[name] = self
+        print('>>>> INIT BATCHER {0} - max_batch_size={1} - max_wait_us={2}'.format(name, self.max_batch_size, self.max_wait_us))
+
+    def submit(self, item):
+        future = concurrent.futures.Future()
+        self._queue.put((item, future, time.perf_counter()))
+        queue_depth = self._queue.qsize()
+        with self._stats_lock:
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        # the wait budget starts when the oldest request was submitted, not when the worker got to it
+        deadline = batch[0][2] + self.max_wait_us / 1e6
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_batch(self, items):
+        '''
+            trả về (is_ok, kết quả hoặc exception) của từng item; khi batch lỗi thì chia đôi đệ quy
+            để một item hỏng (ảnh lỗi của một client) không làm lỗi các request khác trong cùng batch
+        '''
+        try:
+            results = self.batch_fn(items)
+            if len(results) != len(items):
+                raise RuntimeError("batcher {0}: {1} results for {2} requests".format(self.name, len(results), len(items)))
+            return [(True, result) for result in results]
+        except Exception as e:
+            if len(items) == 1:
+                return [(False, e)]
+            with self._stats_lock:
+                self.num_failed_batches += 1
+            middle = len(items) // 2
+            return self._run_batch(items[:middle]) + self._run_batch(items[middle:])
+
+    def _run(self):
+        while True:
+            batch = [request for request in self._collect() if request[1].set_running_or_notify_cancel()]
+            if len(batch) == 0:
+                continue
+            t_start = time.perf_counter()
+            wait_times = [t_start - t_submit for _, _, t_submit in batch]
+            outcomes = self._run_batch([item for item, _, _ in batch])
+            for (_, future, _), (is_ok, value) in zip(batch, outcomes):
+                if is_ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            batch_time = time.perf_counter() - t_start
+
+            with self._stats_lock:
+                self.num_requests += len(batch)
+                self.num_batches += 1
+                self.num_errors += sum(1 for is_ok, _ in outcomes if not is_ok)
+                self.batch_size_histogram[len(batch)] = self.batch_size_histogram.get(len(batch), 0) + 1
+                self.total_wait_time += sum(wait_times)
+                self.max_wait_time = max(self.max_wait_time, max(wait_times))
+                self.total_batch_time += batch_time
+
+    def stats(self):
+        with self._stats_lock:
+            num_requests = self.num_requests
+            num_batches = self.num_batches
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_us": self.max_wait_us,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "num_requests": num_requests,
+                "num_batches": num_batches,
+                "num_errors": self.num_errors,
+                "num_failed_batches": self.num_failed_batches,
+                "mean_batch_size": num_requests / num_batches if num_batches > 0 else 0.0,
+                "batch_size_histogram": dict(sorted(self.batch_size_histogram.items())),
+                "mean_wait_ms": 1000 * self.total_wait_time / num_requests if num_requests > 0 else 0.0,
+                "max_wait_ms": 1000 * self.max_wait_time,
+                "mean_batch_time_ms": 1000 * self.total_batch_time / num_batches if num_batches > 0 else 0.0,
+            }
+
+
+def get_batching_stats():
+    with _batchers_lock:
+        batchers = dict(_batchers)
+    return {name: batcher.stats() for name, batcher in batchers.items()}
+
+
+class BatchedFeatureExtractor:
+    '''
+        FeatureExtractor có batching: mỗi lần gọi với một khuôn mặt được gom với các request khác,
+        list nhiều khuôn mặt đã là một batch nên chạy thẳng
+    '''
+    def __init__(self, feature_extractor, max_batch_size=8, max_wait_us=2000):
+        self.feature_extractor = feature_extractor
+        self.batcher = MicroBatcher('feature_extractor', lambda faces: list(feature_extractor(faces)), max_batch_size, max_wait_us)
+
+    def __call__(self, imgs):
+        if isinstance(imgs, np.ndarray) and imgs.ndim == 3:
+            return self.batcher(imgs)[np.newaxis]
+        return self.feature_extractor(imgs)
+
+    def __getattr__(self, name):
+        return getattr(self.feature_extractor, name)
+
+
+class BatchedFaceDetector:
+    '''
+        SCRFD FaceDetector có batching, cùng interface (status, bboxes, kpss) với FaceDetector.__call__
+    '''
+    def __init__(self, face_detector, max_batch_size=8, max_wait_us=2000):
+        self.face_detector = face_detector
+        self.batcher = MicroBatcher('face_detector', lambda requests: face_detector.detect_many(
+            [img for img, _ in requests], [all_faces for _, all_faces in requests]), max_batch_size, max_wait_us)
+
+    def __call__(self, img, log=None, all_faces=False):
+        return self.face_detector.format_result(*self.batcher((img, all_faces)), log=log)
+
+    def __getattr__(self, name):
+        return getattr(self.face_detector, name)
+
+
+class BatchedAntiSpoofClassifier:
+    '''
+        AntiSpoofClassifier có batching cho route ảnh: các ảnh đồng thời đi qua detector và các model anti-spoof
+        trong một lần forward_batch; request video đã tự chạy theo batch nên dùng thẳng AntiSpoofClassifier
+    '''
+    def __init__(self, anti_spoof_classifier, max_batch_size=8, max_wait_us=2000):
+        self.anti_spoof_classifier = anti_spoof_classifier
+        self.batcher = MicroBatcher('anti_spoof', anti_spoof_classifier.forward_batch_stats, max_batch_size, max_wait_us)
+
+    def predict(self, image, log=None):
+        outputs, stage, num_skipped = self.batcher(image)
+        # decision stage and skipped forwards of this request only, not of the whole shared batch
+        self.anti_spoof_classifier.update_log(log, [stage] if stage is not None else [], num_skipped)
+        return self.anti_spoof_classifier.build_result(*outputs)
+
+    def __getattr__(self, name):
+        return getattr(self.anti_spoof_classifier, name)
@@ -0,0 +1,104 @@
+import cv2
+import numpy as np
+
+# weights of the per-frame quality terms, each term is a rank in [0, 1] within the video
+SHARPNESS_WEIGHT = 0.5
+EXPOSURE_WEIGHT = 0.25
+FACE_SIZE_WEIGHT = 0.25
+
+
+def _rank(values):
+    '''
+        rank chuẩn hoá về [0, 1] (giá trị lớn nhất = 1), không phụ thuộc thang đo của từng chỉ số
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) <= 1:
+        return np.ones(len(values))
+    order = np.argsort(values, kind='stable')
+    ranks = np.empty(len(values))
+    ranks[order] = np.arange(len(values))
+    return ranks / (len(values) - 1)
+
+
+def frame_quality_scores(frames, detections, max_side=160):
+    '''
+        điểm chất lượng rẻ cho từng frame, tính trên ảnh xám đã thu nhỏ (cạnh dài <= max_side) trong vùng khuôn mặt:
+            sharpness - phương sai Laplacian
+            exposure  - độ sáng trung bình gần mức giữa và ít pixel bị cháy / quá tối
+            face size - diện tích bbox trên diện tích frame (lấy từ detection dùng chung)
+        frame không có mặt có quality = 0
+
+        trả về (quality (N,), dict các chỉ số thô)
+    '''
+    num_frames = len(frames)
+    sharpness = np.zeros(num_frames)
+    exposure = np.zeros(num_frames)
+    face_size = np.zeros(num_frames)
+    has_face = np.zeros(num_frames, dtype=bool)
+
+    for i, (frame, (bbox, _)) in enumerate(zip(frames, detections)):
+        if bbox is None:
+            continue
+        height, width = frame.shape[:2]
+        x1, y1, x2, y2 = [int(v) for v in bbox]
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(width, x2), min(height, y2)
+        if x2 <= x1 or y2 <= y1:
+            continue
+
+        scale = min(1.0, float(max_side) / max(x2 - x1, y2 - y1))
+        face = frame[y1:y2, x1:x2]
+        if scale < 1.0:
+            face = cv2.resize(face, (max(1, int((x2 - x1) * scale)), max(1, int((y2 - y1) * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+
+        has_face[i] = True
+        sharpness[i] = cv2.Laplacian(gray, cv2.CV_32F).var()
+        clipped = np.count_nonzero((gray < 10) | (gray > 245)) / gray.size
+        exposure[i] = (1.0 - abs(float(gray.mean()) - 128.0) / 128.0) * (1.0 - clipped)
+        face_size[i] = float((x2 - x1) * (y2 - y1)) / (width * height)
+
+    quality = np.zeros(num_frames)
+    if np.any(has_face):
+        quality[has_face] = (SHARPNESS_WEIGHT * _rank(sharpness[has_face])
+                             + EXPOSURE_WEIGHT * _rank(exposure[has_face])
+                             + FACE_SIZE_WEIGHT * _rank(face_size[has_face]))
+        # any frame with a face ranks above every frame without one
+        quality[has_face] += 1.0
+    return quality, {"sharpness": sharpness, "exposure": exposure, "face_size": face_size}
+
+
+def select_frames(quality, k, directions=None, required_directions=()):
+    '''
+        chọn k frame theo quality, có tính đa dạng:
+            - nếu có directions (hướng mặt của từng frame, None nếu không có mặt), lấy trước frame tốt nhất của mỗi hướng cần có
+            - sau đó chọn tham lam frame tốt nhất còn lại, bỏ qua frame quá gần (theo thời gian) frame đã chọn,
+              khoảng cách tối thiểu giảm dần nếu không đủ frame
+        trả về list index, theo thứ tự được chọn
+    '''
+    num_frames = len(quality)
+    k = min(k, num_frames)
+    order = [int(i) for i in np.argsort(-np.asarray(quality), kind='stable')]
+    selected = []
+
+    if directions is not None:
+        for direction in required_directions:
+            for i in order:
+                if directions[i] == direction and i not in selected:
+                    selected.append(i)
+                    break
+        selected = selected[:k]
+
+    min_gap = max(1, num_frames // (2 * k)) if k > 0 else 1
+    while len(selected) < k:
+        for i in order:
+            if len(selected) >= k:
+                break
+            if i in selected:
+                continue
+            if all(abs(i - j) >= min_gap for j in selected):
+                selected.append(i)
+        if min_gap == 1:
+            break
+        min_gap = max(1, min_gap // 2)
+    return selected
@@ -0,0 +1,81 @@
+import random
+
+import cv2
+import numpy as np
+
+
+class FrameStore:
+    '''
+        bộ nhớ frame có giới hạn cho một request video:
+        các frame được ghi vào một mảng numpy cấp phát sẵn (capacity, H, W, 3) ở working resolution,
+        khi đầy thì reservoir sampling để giữ một mẫu đều trên toàn video mà không vượt quá max_bytes
+    '''
+    def __init__(self, max_bytes, max_frames=0):
+        self.max_bytes = max_bytes
+        self.max_frames = max_frames
+        self.capacity = 0
+        self.num_seen = 0
+        self.size = 0
+        self.capacity_bytes = 0
+        self._buffer = None
+        self._frame_index = None
+
+    @property
+    def peak_bytes(self):
+        '''
+            số byte của các slot đã ghi frame, slot không bao giờ được giải phóng nên size cũng là mức cao nhất
+        '''
+        if self._buffer is None:
+            return 0
+        return self.size * (self._buffer[0].nbytes + self._frame_index.itemsize)
+
+    @property
+    def frame_shape(self):
+        return None if self._buffer is None else self._buffer.shape[1:]
+
+    def _allocate(self, frame):
+        frame_bytes = frame.nbytes
+        capacity = max(2, self.max_bytes // frame_bytes)
+        if self.max_frames > 0:
+            capacity = min(capacity, self.max_frames)
+        self.capacity = int(capacity)
+        self._buffer = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+        self._frame_index = np.zeros(self.capacity, dtype=np.int64)
+        self.capacity_bytes = self._buffer.nbytes + self._frame_index.nbytes
+
+    def _fit(self, frame):
+        height, width = self._buffer.shape[1:3]
+        if frame.shape[:2] != (height, width):
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        return frame
+
+    def add(self, frame):
+        if self._buffer is None:
+            self._allocate(frame)
+
+        frame_index = self.num_seen
+        self.num_seen += 1
+        if self.size < self.capacity:
+            slot = self.size
+            self.size += 1
+        else:
+            slot = random.randint(0, frame_index)
+            if slot >= self.capacity:
+                return
+        self._buffer[slot] = self._fit(frame)
+        self._frame_index[slot] = frame_index
+
+    def frames(self):
+        '''
+            các frame đang giữ theo đúng thứ tự thời gian (view vào buffer, không copy)
+        '''
+        if self._buffer is None:
+            return []
+        order = np.argsort(self._frame_index[:self.size], kind='stable')
+        return [self._buffer[slot] for slot in order]
+
+    def update_log(self, log):
+        log.ex_frame_store_capacity_bytes = int(self.capacity_bytes)
+        log.ex_frame_store_peak_bytes = int(self.peak_bytes)
+        log.ex_frame_store_num_seen = self.num_seen
+        log.ex_frame_store_num_kept = self.size
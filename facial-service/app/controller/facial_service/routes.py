@@ -19,6 +19,7 @@ from app.extensions import *
 from app.controller.facial_service.utils import (
     get_log, img2str)
 from app.controller.facial_service.algorithm import is_video_file
+from app.controller.facial_service.batching import get_batching_stats
 
 blueprint = Blueprint('facial-services', __name__)
 supported_types = [
@@ -217,6 +218,13 @@ def extract_feature():
         logger.info(json.dumps(dataclasses.asdict(log)))
         return response_request, STATUS_CODE_ERROR
     
+@blueprint.route('/batching-stats', methods=['GET'])
+def batching_stats():
+    data = {"batchers": get_batching_stats()}
+    if "facial-recognition" in algorithms:
+        data["face_detector"] = algorithms["facial-recognition"]._face_detector.stats()
+    return jsonify(success=True, data=data), 200
+
 @blueprint.route('/detect-spoofing-image', methods=['POST'])
 def detect_spoofing():
     start_request = time.time()
@@ -255,7 +263,7 @@ def detect_spoofing():
         log.ex_time_decode_image = time.time() - start_time_decode_image
 
         t_start_predict = time.time()
-        result = algorithms['face-anti-spoofing'].predict(face_image)
+        result = algorithms['face-anti-spoofing'].predict(face_image, log)
         log.ex_time_detect_spoofing = time.time() - t_start_predict
         log.rt = round(time.time() - start_request, 3)
         response_request = jsonify(success=True, data=result, trace_id=trace_id)
@@ -273,15 +281,9 @@ def detect_spoofing():
         logger.info(json.dumps(dataclasses.asdict(log)))
         return response_request, 400
     
-@blueprint.route('/detect-spoofing-video', methods=['POST'])
-def anti_spoofing_face():
-    start_request = time.time()
-    trace_id = str(uuid.uuid1())
-    fmt = '%Y-%m-%d %H:%M:%S'
-    now = datetime.now()
-
+def new_request_log(trace_id):
     log = Log(ex_trace_id=trace_id)
-    log.tl = now.strftime(fmt)
+    log.tl = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     log.rid = trace_id
     log.sn = socket.gethostname()
     log.host = request.headers['Host'] if 'Host' in request.headers.keys() else ''
@@ -291,7 +293,6 @@ def anti_spoofing_face():
     log.cip = request.headers['X-Real-Ip'] if 'X-Real-Ip' in request.headers.keys() else ''
     log.rmip = request.remote_addr
     log.mt = request.method
-    log.url = request.url
 
     parsed_url = urlparse(request.url)
     log.urp = parsed_url.path
@@ -300,10 +301,10 @@ def anti_spoofing_face():
         log.url = parsed_url.path + '?' + parsed_url.query
     else:
         log.url = parsed_url.path
+    return log
 
-    InputForm_list = ['video']
-
-    results_schema = {
+def new_spoofing_result():
+    return {
         'label': '',
         'message': '',
         'score': 0,
@@ -311,20 +312,40 @@ def anti_spoofing_face():
         'error_code': ''
     }
 
+def spoofing_response(log, trace_id, start_request, result, success, status_code):
+    log.rt = round(time.time() - start_request, 3)
+    response_request = jsonify(success=success, data=result, trace_id=trace_id)
+    log.bbs = response_request.content_length
+    log.st = status_code
+    log.ex_score = result['score']
+    log.ex_label = result['label']
+    log.ex_message = result['message']
+    log.ex_error_code = result['error_code']
+    logger.info(json.dumps(dataclasses.asdict(log)))
+    return response_request, status_code
+
+def spoofing_error_response(log, trace_id, start_request, result, message, error_code):
+    result['message'] = message
+    result['error_code'] = error_code
+    return spoofing_response(log, trace_id, start_request, result, False, 400)
+
+def spoofing_predict_response(log, trace_id, start_request, result):
+    status_res = 200 if result['error_code'] == '' else 400
+    return spoofing_response(log, trace_id, start_request, result, True, status_res)
+
+@blueprint.route('/detect-spoofing-video', methods=['POST'])
+def anti_spoofing_face():
+    start_request = time.time()
+    trace_id = str(uuid.uuid1())
+    log = new_request_log(trace_id)
+    results_schema = new_spoofing_result()
+
     try:
+        InputForm_list = ['video']
         for elm_form in InputForm_list:
             # Receive  input
             if elm_form not in request.files and elm_form not in request.form:
-                results_schema['message'] = f"No {elm_form} data provided"
-                results_schema['error_code'] = LACK_DATA
-                response_request = jsonify(success=False, data=results_schema, trace_id=trace_id)
-                log.bbs = response_request.content_length
-                log.st = 400
-                log.ex_message = results_schema['message']
-                log.ex_error_code = results_schema['error_code']
-                log.rt = round(time.time() - start_request, 3)
-                logger.info(json.dumps(dataclasses.asdict(log)))
-                return response_request, 400
+                return spoofing_error_response(log, trace_id, start_request, results_schema, f"No {elm_form} data provided", LACK_DATA)
 
         video = request.files['video']
         is_pose_check = 0
@@ -337,41 +358,49 @@ def anti_spoofing_face():
         log.ex_is_pose_check = is_pose_check
 
         if not is_video_file(video):
-            results_schema['message'] = "video invalid"
-            results_schema['error_code'] = VIDEO_INVALID
-            response_request = jsonify(success=False, data=results_schema, trace_id=trace_id)
-            log.bbs = response_request.content_length
-            log.st = 400
-            log.ex_message = results_schema['message']
-            log.ex_error_code = results_schema['error_code']
-            log.rt = round(time.time() - start_request, 3)
-            logger.info(json.dumps(dataclasses.asdict(log)))
-            return response_request, 400
+            return spoofing_error_response(log, trace_id, start_request, results_schema, "video invalid", VIDEO_INVALID)
 
         # call logic at here
         result, image_upload, frame_upload = algorithms['face-anti-spoofing-video'].predict(video, log, results_schema, is_pose_check)
-        status_res = 200 if result['error_code'] == '' else 400
-        log.rt = round(time.time() - start_request, 3)
-        response_request = jsonify(success=True, data=result, trace_id=trace_id)
-        log.bbs = response_request.content_length
-        log.st = status_res
-        log.ex_score = result['score']
-        log.ex_label = result['label']
-        log.ex_message = result['message']
-        log.ex_error_code = result['error_code']
-        logger.info(json.dumps(dataclasses.asdict(log)))
+        return spoofing_predict_response(log, trace_id, start_request, result)
+    
+    except Exception as e:
+        return spoofing_error_response(log, trace_id, start_request, results_schema, "exception : {0}".format(e), EXCEPTION_REQUEST) # pragma: no cover
 
+@blueprint.route('/detect-spoofing-burst', methods=['POST'])
+def anti_spoofing_face_burst():
+    start_request = time.time()
+    trace_id = str(uuid.uuid1())
+    log = new_request_log(trace_id)
+    results_schema = new_spoofing_result()
+
+    try:
+        # bound the body before request.files parses (and buffers) the multipart parts
+        if request.content_length is None or request.content_length > config.BURST_MAX_REQUEST_BYTES:
+            message = "a burst request must declare a Content-Length of at most {0} bytes".format(config.BURST_MAX_REQUEST_BYTES)
+            return spoofing_error_response(log, trace_id, start_request, results_schema, message, BURST_INVALID)
+
+        # Receive input: the burst is sent as several multipart parts named "images", in capture order
+        image_files = request.files.getlist('images')
+        log.ex_burst_num_images = len(image_files)
+        if len(image_files) == 0:
+            return spoofing_error_response(log, trace_id, start_request, results_schema, "No images data provided", LACK_DATA)
+        if len(image_files) < config.BURST_MIN_FRAMES or len(image_files) > config.BURST_MAX_FRAMES:
+            message = "a burst must have from {0} to {1} images".format(config.BURST_MIN_FRAMES, config.BURST_MAX_FRAMES)
+            return spoofing_error_response(log, trace_id, start_request, results_schema, message, BURST_INVALID)
+        # one byte past the limit is enough for decode_burst to reject an oversized still
+        images = [image.read(config.BURST_MAX_IMAGE_BYTES + 1) for image in image_files]
+
+        is_pose_check = 0
+        try:
+            is_pose_check = int(request.form['is_pose_check'])
+        except Exception: # pragma: no cover
+            pass # pragma: no cover
+        log.ex_is_pose_check = is_pose_check
+
+        # call logic at here
+        result, image_upload, frame_upload = algorithms['face-anti-spoofing-video'].predict_burst(images, log, results_schema, is_pose_check)
+        return spoofing_predict_response(log, trace_id, start_request, result)
 
-        return response_request, status_res
-    
     except Exception as e:
-        results_schema['message'] = "exception : {0}".format(e) # pragma: no cover
-        results_schema['error_code'] = EXCEPTION_REQUEST # pragma: no cover
-        response_request = jsonify(success=False, data=results_schema, trace_id=trace_id)
-        log.bbs = response_request.content_length
-        log.st = 400
-        log.ex_message = results_schema['message'] # pragma: no cover
-        log.ex_error_code = results_schema['error_code'] # pragma: no cover
-        log.rt = round(time.time() - start_request, 3)
-        logger.info(json.dumps(dataclasses.asdict(log)))
-        return response_request, 400
\ No newline at end of file
+        return spoofing_error_response(log, trace_id, start_request, results_schema, "exception : {0}".format(e), EXCEPTION_REQUEST) # pragma: no cover
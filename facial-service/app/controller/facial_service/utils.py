@@ -20,6 +20,41 @@ def img2str(img):
     image_base64 = base64.b64encode(buffer).decode('utf-8') # pragma: no cover
     return image_base64 # pragma: no cover
 
+# JPEG start-of-frame markers (baseline, progressive, lossless...), DHT / JPG / DAC share the C4 / C8 / CC range
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def probe_image_size(data):
+    '''
+        đọc (width, height) từ header JPEG / PNG mà không decode ảnh, trả về None nếu không phải JPEG / PNG hợp lệ
+    '''
+    if data[:8] == PNG_SIGNATURE and data[12:16] == b'IHDR' and len(data) >= 24:
+        return int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big')
+    if data[:2] != b'\xff\xd8':
+        return None
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            # fill byte
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            # markers without a length field
+            offset += 2
+            continue
+        length = int.from_bytes(data[offset + 2:offset + 4], 'big')
+        if marker in JPEG_SOF_MARKERS:
+            if offset + 9 > len(data):
+                return None
+            height = int.from_bytes(data[offset + 5:offset + 7], 'big')
+            width = int.from_bytes(data[offset + 7:offset + 9], 'big')
+            return width, height
+        offset += 2 + length
+    return None
+
 def get_diff_timestamp(tstamp1, tstamp2):
     if tstamp1 > tstamp2:
         td = tstamp1 - tstamp2
@@ -0,0 +1,239 @@
+import io
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+
+import cv2
+try:
+    import av
+except ImportError:
+    av = None
+
+
+# fourcc reported by the OpenCV FFMPEG backend -> codec name
+FOURCC_CODEC_MAP = {
+    'avc1': 'h264',
+    'h264': 'h264',
+    'x264': 'h264',
+    'hev1': 'hevc',
+    'hvc1': 'hevc',
+    'hevc': 'hevc',
+    'mp4v': 'mpeg4',
+    'fmp4': 'mpeg4',
+    'vp80': 'vp8',
+    'vp90': 'vp9',
+    'av01': 'av1',
+}
+
+
+DECODE_MODE_SKIP = 'skip'
+DECODE_MODE_GRID = 'grid'
+DECODE_MODE_KEYFRAME = 'keyframe'
+
+
+class VideoMetadataError(ValueError):
+    pass
+
+
+@dataclass
+class VideoMetadata:
+    codec: str = ''
+    # False when the backend gave no usable codec (OpenCV fourcc 0 or a tag missing from FOURCC_CODEC_MAP)
+    is_codec_known: bool = True
+    width: int = 0
+    height: int = 0
+    fps: float = 0.0
+    frame_count: int = 0
+
+    @property
+    def duration(self):
+        if self.fps <= 0 or self.frame_count <= 0:
+            return 0.0
+        return self.frame_count / self.fps
+
+
+def fourcc_to_codec(fourcc):
+    fourcc = int(fourcc)
+    name = ''.join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).strip('\x00 ').lower()
+    return FOURCC_CODEC_MAP.get(name, name)
+
+
+def rotate_frame(frame, degrees_clockwise):
+    degrees_clockwise = int(degrees_clockwise) % 360
+    if degrees_clockwise == 90:
+        return cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
+    if degrees_clockwise == 180:
+        return cv2.rotate(frame, cv2.ROTATE_180)
+    if degrees_clockwise == 270:
+        return cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return frame
+
+
+class VideoDecoder:
+    '''
+        decode video upload ngay trong process: bytes được giữ trong memfd (không ghi file tạm, không gọi ffprobe),
+        metadata lấy từ OpenCV và chỉ retrieve những frame được giữ lại
+
+        mode:
+            skip     - giữ frame có index chia hết cho frame_skip
+            grid     - giữ frame gần nhất với lưới thời gian cách đều grid_interval giây
+            keyframe - chỉ decode keyframe (cần PyAV, nếu không có thì dùng grid)
+        max_side: frame được resize ngay trong decoder để cạnh dài nhất <= max_side (0 = giữ nguyên)
+    '''
+    def __init__(self, max_duration=0.0, max_resolution=0, allowed_codecs=None, max_side=0,
+                 mode=DECODE_MODE_SKIP, grid_interval=0.0):
+        self.max_duration = max_duration
+        self.max_resolution = max_resolution
+        self.allowed_codecs = set(allowed_codecs or [])
+        self.max_side = max_side
+        self.mode = mode
+        self.grid_interval = grid_interval
+        if self.mode == DECODE_MODE_KEYFRAME and av is None:
+            print('>>>>>>   [VideoDecoder] : PyAV is not installed, keyframe mode falls back to grid mode')
+            self.mode = DECODE_MODE_GRID
+
+    def working_size(self, width, height):
+        long_side = max(width, height)
+        if self.max_side <= 0 or long_side <= self.max_side:
+            return width, height
+        scale = self.max_side / long_side
+        return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+    def _resize_to_working(self, frame):
+        height, width = frame.shape[:2]
+        new_width, new_height = self.working_size(width, height)
+        if (new_width, new_height) == (width, height):
+            return frame
+        return cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
+
+    def _keep_frame_fn(self, metadata, frame_skip):
+        if self.mode == DECODE_MODE_SKIP or metadata.fps <= 0 or self.grid_interval <= 0:
+            return lambda frame_index: frame_index % frame_skip == 0
+
+        frame_step = max(1.0, metadata.fps * self.grid_interval)
+
+        def keep_frame(frame_index):
+            # first frame at or after each grid point
+            return frame_index == 0 or int(frame_index / frame_step) > int((frame_index - 1) / frame_step)
+        return keep_frame
+
+    def _open_buffer(self, video_content):
+        if hasattr(os, 'memfd_create'):
+            fd = os.memfd_create('video-upload', 0)
+            os.write(fd, video_content)
+            return fd, '/proc/self/fd/{0}'.format(fd), None
+
+        # no memfd on this platform, fall back to a temporary file
+        temp_video = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
+        temp_video.write(video_content)
+        temp_video.close()
+        return None, temp_video.name, temp_video.name
+
+    def _close_buffer(self, fd, temp_path):
+        if fd is not None:
+            os.close(fd)
+        if temp_path is not None:
+            os.remove(temp_path)
+
+    def read_metadata(self, video_capture):
+        codec = fourcc_to_codec(video_capture.get(cv2.CAP_PROP_FOURCC))
+        return VideoMetadata(
+            codec=codec,
+            is_codec_known=codec in FOURCC_CODEC_MAP.values(),
+            width=int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            height=int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            fps=float(video_capture.get(cv2.CAP_PROP_FPS)),
+            frame_count=int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT)),
+        )
+
+    def check_metadata(self, metadata):
+        if metadata.width <= 0 or metadata.height <= 0:
+            raise VideoMetadataError("Invalid video resolution {0}x{1}".format(metadata.width, metadata.height))
+        if self.max_resolution > 0 and max(metadata.width, metadata.height) > self.max_resolution:
+            raise VideoMetadataError("Video resolution {0}x{1} exceeds {2}".format(metadata.width, metadata.height, self.max_resolution))
+        if self.max_duration > 0 and metadata.duration > self.max_duration:
+            raise VideoMetadataError("Video duration {0:.1f}s exceeds {1}s".format(metadata.duration, self.max_duration))
+        # an unknown codec is left to the decoder, these videos were decoded fine before the whitelist
+        if len(self.allowed_codecs) > 0 and metadata.is_codec_known and metadata.codec not in self.allowed_codecs:
+            raise VideoMetadataError("Video codec '{0}' is not supported".format(metadata.codec))
+
+    def decode(self, video_content, frame_skip=10, frame_store=None):
+        '''
+            trả về (metadata, frames) với frames là các frame BGR (đã resize về working size) được giữ lại theo mode
+            nếu truyền frame_store thì frame được ghi thẳng vào store thay vì giữ trong list
+        '''
+        t_start = time.time()
+        frames = []
+        add_frame = frames.append if frame_store is None else frame_store.add
+        if self.mode == DECODE_MODE_KEYFRAME:
+            metadata = self._decode_keyframes(video_content, add_frame)
+        else:
+            metadata = self._decode_opencv(video_content, frame_skip, add_frame)
+        if frame_store is not None:
+            frames = frame_store.frames()
+        print(f"Time to extract video: {time.time() - t_start:.2f} seconds, Number of frames: {len(frames)}")
+        return metadata, frames
+
+    def _decode_opencv(self, video_content, frame_skip, add_frame):
+        fd, video_path, temp_path = self._open_buffer(video_content)
+        try:
+            video_capture = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+            if not video_capture.isOpened():
+                raise ValueError("Error opening video stream or file")
+
+            try:
+                metadata = self.read_metadata(video_capture)
+                self.check_metadata(metadata)
+                keep_frame = self._keep_frame_fn(metadata, frame_skip)
+
+                frame_count = 0
+                while video_capture.grab():
+                    if keep_frame(frame_count):
+                        ret, frame = video_capture.retrieve()
+                        if not ret:
+                            break
+                        add_frame(self._resize_to_working(frame))
+                    frame_count += 1
+            finally:
+                video_capture.release()
+        finally:
+            self._close_buffer(fd, temp_path)
+
+        return metadata
+
+    def _decode_keyframes(self, video_content, add_frame):
+        container = av.open(io.BytesIO(video_content))
+        try:
+            stream = container.streams.video[0]
+            codec_context = stream.codec_context
+            metadata = VideoMetadata(
+                codec=codec_context.name,
+                is_codec_known=bool(codec_context.name),
+                width=codec_context.width,
+                height=codec_context.height,
+                fps=float(stream.average_rate or 0),
+                frame_count=int(stream.frames or 0),
+            )
+            self.check_metadata(metadata)
+
+            # the decoder drops every non-key frame itself
+            codec_context.skip_frame = 'NONKEY'
+            rotate_tag = stream.metadata.get('rotate')
+            for frame in container.decode(stream):
+                if rotate_tag is not None:
+                    rotate_clockwise = int(rotate_tag)
+                else:
+                    # newer ffmpeg only exposes the display matrix, in counter-clockwise degrees
+                    rotate_clockwise = -int(getattr(frame, 'rotation', 0) or 0)
+                if rotate_clockwise % 180 == 0:
+                    width, height = self.working_size(frame.width, frame.height)
+                else:
+                    height, width = self.working_size(frame.height, frame.width)
+                # scaling and the BGR conversion both happen inside swscale
+                image = frame.to_ndarray(width=width, height=height, format='bgr24')
+                add_frame(rotate_frame(image, rotate_clockwise))
+        finally:
+            container.close()
+
+        return metadata
@@ -75,6 +75,8 @@ class ApplicationConfig:
 
     # Face Detection Settings
     FACE_DETECTION_MODELPATH = os.environ.get('FACE_DETECTION_MODELPATH')
+    FACE_DETECTION_BACKEND = os.environ.get('FACE_DETECTION_BACKEND')
+    FACE_DETECTION_ONNX_PATH = os.environ.get('FACE_DETECTION_ONNX_PATH')
     FACE_DETECTION_MODEL_PATH = os.environ.get('FACE_DETECTION_MODEL_PATH')
     FACE_DETECTION_INDEX_GPU = int(os.environ.get('FACE_DETECTION_INDEX_GPU'))
     FACE_DETECTION_CONF = float(os.environ.get('FACE_DETECTION_CONF'))
@@ -83,9 +85,21 @@ class ApplicationConfig:
     FACE_DETECTION_CONF_THRES = float(os.environ.get('FACE_DETECTION_CONF_THRES'))
     FACE_DETECTION_INPUT_SIZE = int(os.environ.get('FACE_DETECTION_INPUT_SIZE'))
     MIN_SIZE_FACE = int(os.environ.get('MIN_SIZE_FACE'))
+    FACE_DETECTION_ADAPTIVE = int(os.environ.get('FACE_DETECTION_ADAPTIVE'))
+    FACE_DETECTION_SMALL_INPUT_SIZE = int(os.environ.get('FACE_DETECTION_SMALL_INPUT_SIZE'))
+    FACE_DETECTION_BATCH_SIZE = int(os.environ.get('FACE_DETECTION_BATCH_SIZE'))
+    BATCHING_ENABLED = int(os.environ.get('BATCHING_ENABLED'))
+    BATCHING_MAX_BATCH_SIZE = int(os.environ.get('BATCHING_MAX_BATCH_SIZE'))
+    BATCHING_MAX_WAIT_US = int(os.environ.get('BATCHING_MAX_WAIT_US'))
+    VIDEO_TRACKING = int(os.environ.get('VIDEO_TRACKING'))
+    VIDEO_TRACKING_DETECT_INTERVAL = int(os.environ.get('VIDEO_TRACKING_DETECT_INTERVAL'))
+    VIDEO_TRACKING_MAX_SIDE = int(os.environ.get('VIDEO_TRACKING_MAX_SIDE'))
+    VIDEO_TRACKING_MIN_CONFIDENCE = float(os.environ.get('VIDEO_TRACKING_MIN_CONFIDENCE'))
 
     # Face Recognition Settings
     FEATURE_EXTRACTION_MODEL_PATH = os.environ.get('FEATURE_EXTRACTION_MODEL_PATH')
+    FEATURE_EXTRACTION_INT8 = int(os.environ.get('FEATURE_EXTRACTION_INT8'))
+    FEATURE_EXTRACTION_INT8_MODEL_PATH = os.environ.get('FEATURE_EXTRACTION_INT8_MODEL_PATH')
     SIMILARITY_THRESHOLD = float(os.environ.get('SIMILARITY_THRESHOLD'))
 
     # Anti-Spoofing Models
@@ -95,14 +109,25 @@ class ApplicationConfig:
     FAS_MODEL_PATH_2_7 = os.environ.get('FAS_MODEL_PATH_2_7')
     FAS_MODEL_PATH_4_0 = os.environ.get('FAS_MODEL_PATH_4_0')
     FAS_INDEX_GPU = int(os.environ.get('FAS_INDEX_GPU'))
+    FAS_BACKEND = os.environ.get('FAS_BACKEND')
+    FAS_ONNX_CACHE_DIR = os.environ.get('FAS_ONNX_CACHE_DIR')
+    FAS_ONNX_PARITY_ATOL = float(os.environ.get('FAS_ONNX_PARITY_ATOL'))
+    FAS_QUANTIZE_INT8 = int(os.environ.get('FAS_QUANTIZE_INT8'))
+    FAS_CALIBRATION_DIR = os.environ.get('FAS_CALIBRATION_DIR')
+    FAS_CALIBRATION_MAX_IMAGES = int(os.environ.get('FAS_CALIBRATION_MAX_IMAGES'))
+    FAS_INT8_MAX_FLIP_RATE = float(os.environ.get('FAS_INT8_MAX_FLIP_RATE'))
     FAS_CONF_THRESHOLD = float(os.environ.get('FAS_CONF_THRESHOLD'))
     FAS_CONF_THRESHOLD_SUB_MODEL = float(os.environ.get('FAS_CONF_THRESHOLD_SUB_MODEL'))
     FAS_CONF_THRESHOLD_DEEPFAKE_MODEL = float(os.environ.get('FAS_CONF_THRESHOLD_DEEPFAKE_MODEL'))
+    FAS_CASCADE_MODE = int(os.environ.get('FAS_CASCADE_MODE'))
     VOTE_THRESHOLD = float(os.environ.get('VOTE_THRESHOLD'))
+    VOTE_EARLY_STOP = int(os.environ.get('VOTE_EARLY_STOP'))
+    VOTE_CHUNK_SIZE = int(os.environ.get('VOTE_CHUNK_SIZE'))
 
     # GPU Configuration
     DEVICE_GPU = int(os.environ.get('DEVICE_GPU'))
     USE_GPU = DEVICE_GPU >= 0
+    INFERENCE_NUM_THREADS = int(os.environ.get('INFERENCE_NUM_THREADS'))
 
     # Face Area Thresholds
     FACE_AREA_THRESHOLD_POSE = float(os.environ.get('FACE_AREA_THRESHOLD_POSE'))
@@ -111,11 +136,25 @@ class ApplicationConfig:
     # Video Processing
     SKIP_FRAME = int(os.environ.get('SKIP_FRAME'))
     NUM_FRAME_CHECK = int(os.environ.get('NUM_FRAME_CHECK'))
+    FRAME_SELECTION_MODE = os.environ.get('FRAME_SELECTION_MODE')
+    FRAME_QUALITY_MAX_SIDE = int(os.environ.get('FRAME_QUALITY_MAX_SIDE'))
+    VIDEO_MAX_DURATION = float(os.environ.get('VIDEO_MAX_DURATION'))
+    VIDEO_MAX_RESOLUTION = int(os.environ.get('VIDEO_MAX_RESOLUTION'))
+    VIDEO_ALLOWED_CODECS = [codec.strip() for codec in os.environ.get('VIDEO_ALLOWED_CODECS').split(',') if codec.strip()]
+    VIDEO_DECODE_MAX_SIDE = int(os.environ.get('VIDEO_DECODE_MAX_SIDE'))
+    VIDEO_DECODE_MODE = os.environ.get('VIDEO_DECODE_MODE')
+    VIDEO_DECODE_GRID_INTERVAL = float(os.environ.get('VIDEO_DECODE_GRID_INTERVAL'))
+    VIDEO_FRAME_STORE_MAX_BYTES = int(float(os.environ.get('VIDEO_FRAME_STORE_MAX_MB')) * 1024 * 1024)
+    BURST_MIN_FRAMES = int(os.environ.get('BURST_MIN_FRAMES'))
+    BURST_MAX_FRAMES = int(os.environ.get('BURST_MAX_FRAMES'))
+    BURST_MAX_IMAGE_BYTES = int(float(os.environ.get('BURST_MAX_IMAGE_MB')) * 1024 * 1024)
+    # whole multipart body: every still at its limit plus the form fields and part headers
+    BURST_MAX_REQUEST_BYTES = BURST_MAX_FRAMES * BURST_MAX_IMAGE_BYTES + 64 * 1024
 
     # Image Similarity Check
-    THRESHOLD_DUPLICATE_IMAGE_SIMILARITY = float(os.environ.get('THRESHOLD_DUPLICATE_IMAGE_SIMILARITY'))
-    THRESHOLD_DIFFERENT_IMAGE_SIMILARITY = float(os.environ.get('THRESHOLD_DIFFERENT_IMAGE_SIMILARITY'))
-    NUMBER_CHECK_DUPLICATE = int(os.environ.get('NUMBER_CHECK_DUPLICATE'))
+    SIMILARITY_CHECK_MAX_SIDE = int(os.environ.get('SIMILARITY_CHECK_MAX_SIDE'))
+    THRESHOLD_DUPLICATE_FRAME_SIMILARITY = float(os.environ.get('THRESHOLD_DUPLICATE_FRAME_SIMILARITY'))
+    THRESHOLD_DIFFERENT_FRAME_SIMILARITY = float(os.environ.get('THRESHOLD_DIFFERENT_FRAME_SIMILARITY'))
 
     # Redis Configuration
     REDIS_SERVER = os.environ.get('REDIS_SERVER')
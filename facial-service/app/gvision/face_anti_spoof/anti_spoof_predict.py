@@ -9,6 +9,9 @@ import sys
 from app.gvision.face_anti_spoof.model_lib.MiniFASNet import MiniFASNetV1, MiniFASNetV2,MiniFASNetV1SE,MiniFASNetV2SE
 from app.gvision.face_anti_spoof.data_io import transform as trans
 from app.gvision.face_anti_spoof.utility import get_kernel, parse_model_name
+from app.gvision.face_anti_spoof.inference_backend import (load_runner, softmax, export_onnx, onnx_cache_path,
+                                                           OnnxRuntimeRunner, BACKEND_TORCH)
+from app.gvision.quantization import load_calibration_images, split_calibration_images, ImageCalibrationReader, quantize_model, drift_report
 
 
 sys.path.append('./app/gvision/face_anti_spoof')
@@ -54,14 +57,19 @@ class Detection:
 class AntiSpoofPredict(Detection):
     def __init__(self, device_id):
         super(AntiSpoofPredict, self).__init__()
+        self.device_id = device_id
         self.device = torch.device("cuda:{}".format(device_id)
                                    if torch.cuda.is_available() else "cpu")
+        self.backend = BACKEND_TORCH
+        self.runner = None
         print("INIT AntiSpoofPredict :: [DEVICE] :: ", self.device)
 
     def _load_model(self, model_path):
         # define model
         model_name = os.path.basename(model_path)
         h_input, w_input, model_type, _ = parse_model_name(model_name)
+        self.model_path = model_path
+        self.input_shape = (3, h_input, w_input)
         self.kernel_size = get_kernel(h_input, w_input,)
         self.model = MODEL_MAPPING[model_type](conv6_kernel=self.kernel_size).to(self.device)
 
@@ -93,15 +101,34 @@ class AntiSpoofPredict(Detection):
             result = F.softmax(result, dim=1).cpu().numpy()
         return result
 
+    def use_backend(self, backend, cache_dir, atol=1e-3):
+        """Run inference through an exported ONNX model (onnxruntime / opencv) instead of eager torch."""
+        self.model.eval()
+        # MiniFASNet takes raw BGR values, same as trans.ToTensor (no scaling)
+        self.runner = load_runner(backend, self.model, self.model_path, self.input_shape, (0, 255),
+                                  cache_dir, device_id=self.device_id, atol=atol)
+        self.backend = backend if self.runner is not None else BACKEND_TORCH
+
     def inference(self, img):
-        test_transform = trans.Compose([
-            trans.ToTensor(),
-        ])
-        img = test_transform(img)
-        img = img.unsqueeze(0).to(self.device)
+        return self.inference_batch([img])
+
+    def inference_batch(self, imgs):
+        """Run a list of crops of the same size through the model in one forward pass.
+
+        Returns an (N, 3) array of softmax scores, row i belonging to imgs[i].
+        """
+        # same as trans.ToTensor: HWC -> CHW, float, no scaling
+        batch = np.stack([img.transpose((2, 0, 1)) for img in imgs]).astype(np.float32)
+        return self.inference_tensor(batch)
+
+    def inference_tensor(self, batch):
+        """Run an already preprocessed (N, 3, H, W) float32 batch, returns (N, 3) softmax scores."""
+        if self.runner is not None:
+            return softmax(self.runner(batch))
+
         self.model.eval()
         with torch.no_grad():
-            result = self.model.forward(img)
+            result = self.model.forward(torch.from_numpy(batch).to(self.device))
             result = F.softmax(result, dim=1).cpu().numpy()
         return result
 
@@ -159,12 +186,19 @@ class CropImage:
 
 
 class ImageClassifier:
+    MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+    STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
     def __init__(self, model_path, arch='resnet50', num_classes=2, input_size=224, device_id=0):
         self.device = f"cuda:{device_id}" if torch.cuda.is_available() else "cpu"
         print(">>>>>>   ImageClassifier ::: Device ::: ", self.device, "  ::: Model_path ::: ", model_path)
 
+        self.model_path = model_path
+        self.device_id = device_id
         self.input_size = input_size
         self.model = self._load_model(model_path, arch, num_classes)
+        self.backend = BACKEND_TORCH
+        self.runner = None
         
     def _load_model(self, model_path, arch, num_classes):
         # print(f">>>>>>  ImageClassifier :: Creating model :: '{arch}'")
@@ -174,15 +208,68 @@ class ImageClassifier:
         model.eval()  # Set the model to evaluation mode
         return model
 
+    def use_backend(self, backend, cache_dir, atol=1e-3):
+        """Run inference through an exported ONNX model (onnxruntime / opencv) instead of eager torch."""
+        # inputs are ImageNet-normalized, roughly within [-2.2, 2.7]
+        self.runner = load_runner(backend, self.model, self.model_path, (3, self.input_size, self.input_size), (-2.2, 2.7),
+                                  cache_dir, output_index=1, device_id=self.device_id, atol=atol)
+        self.backend = backend if self.runner is not None else BACKEND_TORCH
+
+    def use_int8(self, cache_dir, calibration_dir, threshold, max_calibration_images=0, max_flip_rate=0.0,
+                 holdout_fraction=0.25):
+        """
+        Run the classifier as an INT8 ONNX model on onnxruntime (CPU).
+
+        The crops of `calibration_dir` are split into a calibration set, used to quantize the model statically
+        (cached as <stem>.int8.onnx), and a held-out set. The fp32 and INT8 scores of the held-out crops are
+        compared at `threshold`; the fp32 model is kept when there is no held-out crop to verify on or when more
+        than `max_flip_rate` of the decisions flip.
+
+        Returns:
+            dict: the drift report.
+        """
+        self.model.eval()
+        images = load_calibration_images(calibration_dir, max_calibration_images)
+        calibration_images, holdout_images = split_calibration_images(images, holdout_fraction)
+        if len(holdout_images) == 0:
+            report = drift_report(np.zeros((0, 2)), np.zeros((0, 2)), threshold)
+            self.quantization_report = report
+            print('>>>>>>   [INT8] : {0} calibration image(s) in {1}, cannot verify INT8, keep fp32 for {2}'.format(
+                len(images), calibration_dir, self.model_path))
+            return report
+
+        int8_path = onnx_cache_path(cache_dir, self.model_path, '.int8')
+        if not os.path.exists(int8_path):
+            fp32_path = onnx_cache_path(cache_dir, self.model_path)
+            if not os.path.exists(fp32_path):
+                export_onnx(self.model, (3, self.input_size, self.input_size), fp32_path, output_index=1)
+            calibration_reader = ImageCalibrationReader(calibration_images, lambda image: self._preprocess_image(image).cpu().numpy())
+            quantize_model(fp32_path, int8_path, calibration_reader)
+
+        runner = OnnxRuntimeRunner(int8_path)
+        fp32_scores, int8_scores = [], []
+        for start in range(0, len(holdout_images), 16):
+            image_tensor = torch.cat([self._preprocess_image(image) for image in holdout_images[start:start + 16]], dim=0)
+            fp32_scores.append(self._forward_torch(image_tensor))
+            int8_scores.append(softmax(runner(image_tensor.cpu().numpy())))
+        report = drift_report(np.concatenate(fp32_scores), np.concatenate(int8_scores), threshold)
+        self.quantization_report = report
+        print('>>>>>>   [INT8] : {0} drift report on {1} held-out crops :: {2}'.format(int8_path, len(holdout_images), report))
+
+        if report["flip_rate"] > max_flip_rate:
+            print('>>>>>>   [INT8] : flip rate {0:.4f} > {1}, keep fp32 for {2}'.format(report["flip_rate"], max_flip_rate, self.model_path))
+            return report
+        self.runner = runner
+        self.backend = 'onnxruntime-int8'
+        return report
+
     def _preprocess_image(self, image):
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)  # Convert BGR to RGB
         image = cv2.resize(image, (self.input_size, self.input_size))  # Resize the image
 
         # Normalize the image
         image = image.astype(np.float32) / 255.0  # Normalize to [0, 1]
-        mean = np.array([0.485, 0.456, 0.406])
-        std = np.array([0.229, 0.224, 0.225])
-        image = (image - mean) / std
+        image = (image - self.MEAN) / self.STD
 
         # Convert the numpy array to a tensor
         image_tensor = torch.from_numpy(image.transpose(2, 0, 1))  # Change from HWC to CHW format
@@ -190,18 +277,31 @@ class ImageClassifier:
         return image_tensor.type(torch.float32).to(self.device)
 
     def predict(self, image, threshold = 0.5):
-        image_tensor = self._preprocess_image(image)
+        return self.predict_batch([image])[0]
 
-        # Perform inference
+    def predict_batch(self, images):
+        """Classify a list of images in a single forward pass.
+
+        Returns an (N, num_classes) array of probabilities, row i belonging to images[i].
+        """
+        image_tensor = torch.cat([self._preprocess_image(image) for image in images], dim=0)
+        if self.runner is not None:
+            return softmax(self.runner(image_tensor.cpu().numpy()))
+        return self._forward_torch(image_tensor)
+
+    def predict_tensor(self, batch):
+        """Classify an already preprocessed (N, 3, H, W) float32 batch (RGB, ImageNet-normalized)."""
+        if self.runner is not None:
+            return softmax(self.runner(batch))
+        return self._forward_torch(torch.from_numpy(batch).to(self.device))
+
+    def _forward_torch(self, image_tensor):
         with torch.no_grad():
             output = self.model(image_tensor)
 
-        classification_output = output[1]
-
-        # Apply softmax to get probabilities
-        probabilities = F.softmax(classification_output, dim=1)
+        probabilities = F.softmax(output[1], dim=1)
 
-        return probabilities[0].cpu().numpy()
+        return probabilities.cpu().numpy()
 
 
 
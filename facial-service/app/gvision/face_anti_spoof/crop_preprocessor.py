@@ -0,0 +1,136 @@
+import threading
+import cv2
+import numpy as np
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def square_crop_rects(box, image_shape, paddings):
+    """
+    Square, padded crop rectangles of one face box for several paddings at once, same integer
+    arithmetic as Face_Landmark.crop_image_with_padding.
+
+    Args:
+        box: (xmin, ymin, xmax, ymax) integer face box.
+        image_shape: shape of the frame.
+        paddings: K padding ratios.
+
+    Returns:
+        np.ndarray: (K, 4) int64 rects (xmin, ymin, xmax, ymax).
+    """
+    image_height, image_width = image_shape[:2]
+    xmin, ymin, xmax, ymax = [int(v) for v in box]
+    paddings = np.asarray(paddings, dtype=np.float64)
+
+    # int() truncates toward zero, box sizes are non-negative so floor is the same
+    padding_width = np.floor((xmax - xmin) * paddings).astype(np.int64)
+    padding_height = np.floor((ymax - ymin) * paddings).astype(np.int64)
+    x1 = xmin - padding_width
+    y1 = ymin - padding_height
+    x2 = xmax + padding_width
+    y2 = ymax + padding_height
+
+    # equal padding on all sides
+    diff = (x2 - x1) - (y2 - y1)
+    is_wide = diff > 0
+    y1 = np.where(is_wide, y1 - diff // 2, y1)
+    y2 = np.where(is_wide, y2 + diff // 2, y2)
+    x1 = np.where(is_wide, x1, x1 - (-diff) // 2)
+    x2 = np.where(is_wide, x2, x2 + (-diff) // 2)
+
+    x1 = np.maximum(0, x1)
+    y1 = np.maximum(0, y1)
+    x2 = np.minimum(image_width, x2)
+    y2 = np.minimum(image_height, y2)
+
+    # keep the box square inside the image bounds
+    width = x2 - x1
+    height = y2 - y1
+    is_wide = width > height
+    y2 = np.where(is_wide, y1 + width, y2)
+    y1 = np.where(is_wide & (y2 > image_height), image_height - width, y1)
+    y2 = np.where(is_wide & (y2 > image_height), image_height, y2)
+    x2 = np.where(is_wide, x2, x1 + height)
+    x1 = np.where(~is_wide & (x2 > image_width), image_width - height, x1)
+    x2 = np.where(~is_wide & (x2 > image_width), image_width, x2)
+
+    x1 = np.maximum(0, x1)
+    y1 = np.maximum(0, y1)
+    x2 = np.minimum(image_width, x2)
+    y2 = np.minimum(image_height, y2)
+    return np.stack([x1, y1, x2, y2], axis=1)
+
+
+class AntiSpoofCropPreprocessor:
+    '''
+        cắt 4 crop anti-spoof của mỗi khuôn mặt (224 @0.02, 224 @0.5, 80 @0.2, 80 @0.5) trong một lượt:
+        mỗi crop được warpAffine thẳng từ frame gốc (không copy vùng crop, không resize lần hai)
+        rồi ghi vào các buffer float32 NCHW cấp phát sẵn theo từng thread, normalize đã gộp vào bước ghi
+
+        outputs:
+            classifier_batch: (2N, 3, 224, 224) RGB chuẩn hoá ImageNet - N crop 0.02 rồi N crop 0.5 (ResNet50)
+            crops_2_7, crops_4_0: (N, 3, 80, 80) BGR giá trị gốc 0..255 (MiniFASNet)
+    '''
+    def __init__(self, classifier_size=224, fasnet_size=80, mean=IMAGENET_MEAN, std=IMAGENET_STD):
+        self.classifier_size = classifier_size
+        self.fasnet_size = fasnet_size
+        self.paddings = (0.02, 0.5, 0.2, 0.5)
+        self.sizes = (classifier_size, classifier_size, fasnet_size, fasnet_size)
+        # (x / 255 - mean) / std == x * scale - offset, channels in RGB order
+        std = np.asarray(std, dtype=np.float32)
+        self.scale = (1.0 / (255.0 * std)).reshape((3, 1, 1)).astype(np.float32)
+        self.offset = (np.asarray(mean, dtype=np.float32) / std).reshape((3, 1, 1)).astype(np.float32)
+        self._local = threading.local()
+
+    def _buffer(self, name, shape, dtype=np.float32):
+        '''
+            buffer của thread hiện tại, chỉ cấp phát lại khi batch lớn hơn lần trước
+        '''
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buffer = buffers.get(name)
+        if buffer is None or buffer.shape[0] < shape[0] or buffer.shape[1:] != tuple(shape[1:]):
+            buffer = np.empty(shape, dtype=dtype)
+            buffers[name] = buffer
+        return buffer[:shape[0]]
+
+    def _warp(self, image, rect, image_size):
+        x1, y1, x2, y2 = [int(v) for v in rect]
+        width, height = x2 - x1, y2 - y1
+        if width <= 0 or height <= 0:
+            raise ValueError("Empty face crop {0}".format((x1, y1, x2, y2)))
+        scale_x = float(width) / image_size
+        scale_y = float(height) / image_size
+        # destination -> source map of cv2.resize (pixel centers aligned), applied to the full frame
+        M = np.array([[scale_x, 0, x1 + 0.5 * scale_x - 0.5],
+                      [0, scale_y, y1 + 0.5 * scale_y - 0.5]], dtype=np.float64)
+        crop = self._buffer('crop_{0}'.format(image_size), (image_size, image_size, 3), np.uint8)
+        cv2.warpAffine(image, M, (image_size, image_size), dst=crop,
+                       flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE)
+        return crop
+
+    def __call__(self, images, boxes):
+        '''
+            images: list các frame BGR, boxes: bbox khuôn mặt tương ứng
+            trả về (classifier_batch, crops_2_7, crops_4_0), là view vào buffer của thread nên phải dùng trước lần gọi tiếp theo
+        '''
+        num_images = len(images)
+        classifier_batch = self._buffer('classifier', (2 * num_images, 3, self.classifier_size, self.classifier_size))
+        crops_2_7 = self._buffer('crops_2_7', (num_images, 3, self.fasnet_size, self.fasnet_size))
+        crops_4_0 = self._buffer('crops_4_0', (num_images, 3, self.fasnet_size, self.fasnet_size))
+        outputs = (classifier_batch[:num_images], classifier_batch[num_images:], crops_2_7, crops_4_0)
+
+        for i, (image, box) in enumerate(zip(images, boxes)):
+            rects = square_crop_rects(box, image.shape, self.paddings)
+            for k, (rect, image_size) in enumerate(zip(rects, self.sizes)):
+                crop = self._warp(image, rect, image_size).transpose((2, 0, 1))
+                out = outputs[k][i]
+                if k < 2:
+                    # BGR -> RGB and ImageNet normalization in one write
+                    np.multiply(crop[::-1], self.scale, out=out)
+                    np.subtract(out, self.offset, out=out)
+                else:
+                    out[...] = crop
+        return classifier_batch, crops_2_7, crops_4_0
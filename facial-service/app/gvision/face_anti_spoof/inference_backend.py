@@ -0,0 +1,128 @@
+import os
+import threading
+import cv2
+import numpy as np
+import torch
+from app.gvision.num_threads import session_options
+
+BACKEND_TORCH = 'torch'
+BACKEND_ONNXRUNTIME = 'onnxruntime'
+BACKEND_OPENCV = 'opencv'
+
+
+def softmax(logits):
+    logits = logits - np.max(logits, axis=1, keepdims=True)
+    e_x = np.exp(logits)
+    return e_x / np.sum(e_x, axis=1, keepdims=True)
+
+
+class _OutputSelector(torch.nn.Module):
+    """Keep a single tensor of a model returning a tuple, e.g. the logits of ResNet's (features, logits)."""
+
+    def __init__(self, model, output_index=None):
+        super(_OutputSelector, self).__init__()
+        self.model = model
+        self.output_index = output_index
+
+    def forward(self, x):
+        output = self.model(x)
+        if self.output_index is not None:
+            output = output[self.output_index]
+        return output
+
+
+def export_onnx(model, input_shape, onnx_path, output_index=None, opset_version=11):
+    """
+    Export a torch classifier to ONNX with a dynamic batch axis.
+
+    Args:
+        input_shape (tuple): (C, H, W) of one sample.
+        output_index (int): index of the logits when the model returns a tuple.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(onnx_path)), exist_ok=True)
+    device = next(model.parameters()).device
+    dummy_input = torch.zeros((1,) + tuple(input_shape), dtype=torch.float32, device=device)
+    model.eval()
+    with torch.no_grad():
+        torch.onnx.export(_OutputSelector(model, output_index), dummy_input, onnx_path,
+                          input_names=['input'], output_names=['logits'],
+                          dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+                          opset_version=opset_version)
+    print('>>>>>>   [ONNX] : exported {0}'.format(onnx_path))
+    return onnx_path
+
+
+class OnnxRuntimeRunner:
+    def __init__(self, onnx_path, device_id=-1):
+        import onnxruntime
+        if device_id >= 0:
+            providers = [('CUDAExecutionProvider', {'device_id': device_id}), 'CPUExecutionProvider']
+        else:
+            providers = ['CPUExecutionProvider']
+        self.session = onnxruntime.InferenceSession(onnx_path, sess_options=session_options(), providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenCVDnnRunner:
+    def __init__(self, onnx_path, device_id=-1):
+        self.net = cv2.dnn.readNetFromONNX(onnx_path)
+        if device_id >= 0:
+            self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+            self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
+        # a cv2.dnn.Net keeps its input/output blobs, one forward at a time
+        self._lock = threading.Lock()
+
+    def __call__(self, batch):
+        with self._lock:
+            self.net.setInput(batch)
+            return self.net.forward().copy()
+
+
+RUNNERS = {
+    BACKEND_ONNXRUNTIME: OnnxRuntimeRunner,
+    BACKEND_OPENCV: OpenCVDnnRunner,
+}
+
+
+def parity_check(model, runner, input_shape, input_range, output_index=None, atol=1e-3, batch_size=2):
+    """Compare softmax outputs of the torch model and the runner on random inputs, returns the max abs difference."""
+    low, high = input_range
+    batch = np.random.uniform(low, high, (batch_size,) + tuple(input_shape)).astype(np.float32)
+    device = next(model.parameters()).device
+    with torch.no_grad():
+        output = model(torch.from_numpy(batch).to(device))
+        if output_index is not None:
+            output = output[output_index]
+        expected = torch.softmax(output, dim=1).cpu().numpy()
+    max_diff = float(np.max(np.abs(softmax(runner(batch)) - expected)))
+    return max_diff <= atol, max_diff
+
+
+def onnx_cache_path(cache_dir, model_path, suffix=''):
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(model_path))[0] + suffix + '.onnx')
+
+
+def load_runner(backend, model, model_path, input_shape, input_range, cache_dir, output_index=None, device_id=-1, atol=1e-3):
+    """
+    Return an ONNX runner for `model`, exporting it to `cache_dir` the first time.
+    Returns None (keep running torch) for the torch backend or when the parity check fails.
+    """
+    if backend == BACKEND_TORCH:
+        return None
+    if backend not in RUNNERS:
+        raise ValueError("Unknown inference backend '{0}'".format(backend))
+
+    onnx_path = onnx_cache_path(cache_dir, model_path)
+    if not os.path.exists(onnx_path):
+        export_onnx(model, input_shape, onnx_path, output_index)
+
+    runner = RUNNERS[backend](onnx_path, device_id)
+    is_match, max_diff = parity_check(model, runner, input_shape, input_range, output_index, atol)
+    print('>>>>>>   [{0}] : {1} parity max diff = {2:.2e}'.format(backend, onnx_path, max_diff))
+    if not is_match:
+        print('>>>>>>   [{0}] : parity check failed for {1}, keep torch'.format(backend, onnx_path))
+        return None
+    return runner
@@ -1,6 +1,5 @@
 import cv2
 import numpy as np
-from skimage import transform as trans
 
 src1 = np.array([[51.642, 50.115], [57.617, 49.990], [35.740, 69.007],
                  [51.157, 89.050], [57.025, 89.702]],
@@ -35,43 +34,119 @@ arcface_src = np.array(
 
 arcface_src = np.expand_dims(arcface_src, axis=0)
 
-# In[66]:
+_template_cache = {}
+
+
+def get_templates(image_size=112, mode='arcface'):
+    """(T, 5, 2) float64 template landmarks for image_size / mode, scaled once and cached."""
+    key = (image_size, mode)
+    templates = _template_cache.get(key)
+    if templates is None:
+        if mode == 'arcface':
+            templates = float(image_size) / 112 * arcface_src
+        else:
+            templates = src_map[image_size]
+        templates = templates.astype(np.float64)
+        _template_cache[key] = templates
+    return templates
+
+
+def umeyama(src, dst):
+    """
+    Least-squares similarity transform (rotation, uniform scale, translation) mapping src onto dst
+    (Umeyama, 1991), same solution as skimage SimilarityTransform.estimate, degenerate cases included:
+    collinear points (rank 1) take skimage's rotation / reflection choice, and when all src or all dst points
+    coincide (rank 0) the matrix is NaN, where skimage's estimate returns False with NaN params.
+
+    Args:
+        src, dst (np.ndarray): (..., N, 2) point sets, leading dimensions are broadcast.
+
+    Returns:
+        np.ndarray: (..., 2, 3) affine matrices.
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    src, dst = np.broadcast_arrays(src, dst)
+    num = src.shape[-2]
+
+    src_mean = src.mean(axis=-2)
+    dst_mean = dst.mean(axis=-2)
+    src_demean = src - src_mean[..., np.newaxis, :]
+    dst_demean = dst - dst_mean[..., np.newaxis, :]
+
+    A = np.swapaxes(dst_demean, -1, -2) @ src_demean / num
+    d = np.ones(A.shape[:-1], dtype=np.float64)
+    d[np.linalg.det(A) < 0, 1] = -1
+
+    U, S, V = np.linalg.svd(A)
+    rank = np.linalg.matrix_rank(A)
+    # rank deficient: U @ V when it is already a rotation, otherwise U @ diag(1, -1) @ V;
+    # the scale keeps the d of eq. (39) either way
+    d_rotation = d.copy()
+    is_deficient = rank == 1
+    d_rotation[is_deficient] = 1
+    d_rotation[is_deficient & (np.linalg.det(U) * np.linalg.det(V) <= 0), 1] = -1
+    T = U @ (d_rotation[..., :, np.newaxis] * V)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # zero variance only when rank == 0, overwritten with NaN below
+        scale = np.sum(S * d, axis=-1) / src_demean.var(axis=-2).sum(axis=-1)
+    T = T * scale[..., np.newaxis, np.newaxis]
+    translation = dst_mean - (T @ src_mean[..., :, np.newaxis])[..., 0]
+    M = np.concatenate([T, translation[..., :, np.newaxis]], axis=-1)
+    M[rank == 0] = np.nan
+    return M
+
+
+def estimate_norm_batch(lmks, image_size=112, mode='arcface'):
+    """
+    Fit every template to every face at once and keep, per face, the template with the lowest reprojection error.
+    A failed fit (NaN matrix, see umeyama) is never picked; a face whose landmarks all coincide gets a NaN matrix.
+
+    Args:
+        lmks (np.ndarray): (F, 5, 2) landmarks.
+
+    Returns:
+        (np.ndarray, np.ndarray): (F, 2, 3) matrices and (F,) template indexes.
+    """
+    lmks = np.asarray(lmks, dtype=np.float64)
+    assert lmks.ndim == 3 and lmks.shape[1:] == (5, 2)
+    templates = get_templates(image_size, mode)
+    M = umeyama(lmks[:, np.newaxis], templates[np.newaxis])  # (F, T, 2, 3)
+    results = M[..., :2] @ np.swapaxes(lmks, -1, -2)[:, np.newaxis] + M[..., 2:]  # (F, T, 2, 5)
+    error = np.sum(np.sqrt(np.sum((np.swapaxes(results, -1, -2) - templates) ** 2, axis=-1)), axis=-1)
+    min_index = np.argmin(np.where(np.isnan(error), np.inf, error), axis=1)
+    return M[np.arange(len(lmks)), min_index], min_index
 
 
 # lmk is prediction; src is template
 def estimate_norm(lmk, image_size=112, mode='arcface'):
     assert lmk.shape == (5, 2)
-    tform = trans.SimilarityTransform()
-    lmk_tran = np.insert(lmk, 2, values=np.ones(5), axis=1)
-    min_M = []
-    min_index = []
-    min_error = float('inf')
-    if mode == 'arcface':
-        if image_size == 112:
-            src = arcface_src
-        else:
-            src = float(image_size) / 112 * arcface_src
-    else:
-        src = src_map[image_size]
-    for i in np.arange(src.shape[0]):
-        tform.estimate(lmk, src[i])
-        M = tform.params[0:2, :]
-        results = np.dot(M, lmk_tran.T)
-        results = results.T
-        error = np.sum(np.sqrt(np.sum((results - src[i])**2, axis=1)))
-        #         print(error)
-        if error < min_error:
-            min_error = error
-            min_M = M
-            min_index = i
-    return min_M, min_index
+    M, min_index = estimate_norm_batch(lmk[np.newaxis], image_size, mode)
+    return M[0], min_index[0]
+
+
+def check_norm(M):
+    # warpAffine turns a NaN matrix into a black crop, fail like the skimage estimate did instead
+    if np.any(np.isnan(M)):
+        raise ValueError("cannot align a face whose landmarks all coincide")
 
 
 def norm_crop(img, landmark, image_size=112, mode='arcface'):
     M, pose_index = estimate_norm(landmark, image_size, mode)
+    check_norm(M)
     warped = cv2.warpAffine(img, M, (image_size, image_size), borderValue=0.0)
     return warped
 
+
+def norm_crop_batch(img, kpss, image_size=112, mode='arcface'):
+    """Align every face of kpss (F, 5, 2) in img, returns a list of F aligned crops."""
+    if len(kpss) == 0:
+        return []
+    M, pose_index = estimate_norm_batch(kpss, image_size, mode)
+    check_norm(M)
+    return [cv2.warpAffine(img, m, (image_size, image_size), borderValue=0.0) for m in M]
+
 def square_crop(im, S):
     if im.shape[0] > im.shape[1]:
         height = S
@@ -88,6 +163,7 @@ def square_crop(im, S):
 
 
 def transform(data, center, output_size, scale, rotation):
+    from skimage import transform as trans
     scale_ratio = scale
     rot = float(rotation) * np.pi / 180.0
     #translation = (output_size/2-center[0]*scale_ratio, output_size/2-center[1]*scale_ratio)
@@ -0,0 +1,143 @@
+import cv2
+import numpy as np
+
+
+class FaceTracker:
+    """
+    Propagate the largest face (bbox + 5 keypoints) through a frame sequence with sparse optical flow,
+    running the detector only on every `redetect_interval`-th frame and whenever the track is lost.
+    Frames that need re-detection are detected in batches: a frame without a face to follow is detected
+    together with the next `batch_size` frames, and the look-ahead of consecutive lost tracks doubles up to it.
+
+    Points tracked between two consecutive frames are the 5 keypoints plus a grid inside the bbox,
+    on grayscale frames downscaled to `max_side`. A point is kept when both the forward and the backward
+    pyramidal Lucas-Kanade passes find it and the forward-backward error is below `max_fb_error`
+    (downscaled pixels). The box moves by the median displacement of the kept grid points and scales by
+    the median ratio of their pairwise distances (MedianFlow). The frame is re-detected when the kept
+    fraction falls below `min_confidence` or a keypoint is lost.
+
+    Args:
+        face_detector: Face_Landmark (predict_batch / first_face).
+    """
+
+    def __init__(self, face_detector, redetect_interval=10, max_side=320, min_confidence=0.6,
+                 max_fb_error=1.0, grid_size=6, batch_size=16):
+        self.face_detector = face_detector
+        self.redetect_interval = max(1, redetect_interval)
+        self.max_side = max_side
+        self.min_confidence = min_confidence
+        self.max_fb_error = max_fb_error
+        self.grid_size = grid_size
+        self.batch_size = max(1, batch_size)
+        self.lk_params = dict(winSize=(15, 15), maxLevel=3,
+                              criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+    def _detect(self, frames):
+        detections = []
+        for i in range(0, len(frames), self.batch_size):
+            detections += [self.face_detector.first_face(*faces)
+                           for faces in self.face_detector.predict_batch(frames[i:i + self.batch_size], select_largest=True)]
+        return detections
+
+    def _gray(self, frame):
+        height, width = frame.shape[:2]
+        scale = min(1.0, float(self.max_side) / max(height, width))
+        if scale < 1.0:
+            frame = cv2.resize(frame, (max(1, int(round(width * scale))), max(1, int(round(height * scale)))),
+                               interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), scale
+
+    def _grid_points(self, bbox):
+        x1, y1, x2, y2 = bbox
+        # keep the grid off the box border, which is mostly background
+        xs = np.linspace(x1, x2, self.grid_size + 2)[1:-1]
+        ys = np.linspace(y1, y2, self.grid_size + 2)[1:-1]
+        return np.stack(np.meshgrid(xs, ys), axis=-1).reshape((-1, 2))
+
+    def _track_points(self, prev_gray, gray, points):
+        points = points.astype(np.float32).reshape((-1, 1, 2))
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, points, None, **self.lk_params)
+        back_points, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, prev_gray, next_points, None, **self.lk_params)
+        fb_error = np.linalg.norm(points - back_points, axis=2).reshape(-1)
+        is_valid = (status.reshape(-1) == 1) & (back_status.reshape(-1) == 1) & (fb_error < self.max_fb_error)
+        return next_points.reshape((-1, 2)), is_valid
+
+    def _propagate(self, prev_gray, gray, scale, bbox, kps):
+        """Returns (bbox, kps, confidence) in full-resolution coordinates, bbox None when the track is lost."""
+        bbox_small = np.asarray(bbox, dtype=np.float64) * scale
+        kps_small = np.asarray(kps, dtype=np.float64) * scale
+        grid = self._grid_points(bbox_small)
+        points = np.concatenate([kps_small, grid])
+        next_points, is_valid = self._track_points(prev_gray, gray, points)
+
+        num_kps = len(kps_small)
+        grid_valid = is_valid[num_kps:]
+        confidence = float(np.mean(grid_valid))
+        if confidence < self.min_confidence or not np.all(is_valid[:num_kps]):
+            return None, None, confidence
+
+        old_grid = grid[grid_valid]
+        new_grid = next_points[num_kps:][grid_valid]
+        shift = np.median(new_grid - old_grid, axis=0)
+        pair_i, pair_j = np.triu_indices(len(old_grid), k=1)
+        old_dist = np.linalg.norm(old_grid[pair_i] - old_grid[pair_j], axis=1)
+        new_dist = np.linalg.norm(new_grid[pair_i] - new_grid[pair_j], axis=1)
+        box_scale = float(np.median(new_dist[old_dist > 0] / old_dist[old_dist > 0])) if np.any(old_dist > 0) else 1.0
+
+        center = (bbox_small[:2] + bbox_small[2:]) / 2 + shift
+        half_size = (bbox_small[2:] - bbox_small[:2]) / 2 * box_scale
+        new_bbox = np.concatenate([center - half_size, center + half_size]) / scale
+        new_kps = next_points[:num_kps] / scale
+        return new_bbox, new_kps, confidence
+
+    def track(self, frames):
+        """
+        Returns:
+            (detections, is_detected): one (bbox, kps) per frame in the first_face format, and whether
+            each result comes from the detector (True) or from tracking (False).
+        """
+        num_frames = len(frames)
+        detections = [(None, None)] * num_frames
+        is_detected = [False] * num_frames
+        if num_frames == 0:
+            return detections, is_detected
+
+        # scheduled key frames go to the detector in batches
+        key_indexes = list(range(0, num_frames, self.redetect_interval))
+        for index, detection in zip(key_indexes, self._detect([frames[i] for i in key_indexes])):
+            detections[index] = detection
+            is_detected[index] = True
+
+        prev_gray, scale = self._gray(frames[0])
+        # unrounded box of the previous frame, so integer truncation does not accumulate along the track
+        prev_bbox = detections[0][0]
+        # frames detected together when the track is lost, doubles while re-detection keeps being needed
+        num_lookahead = 1
+        for index in range(1, num_frames):
+            gray, scale = self._gray(frames[index])
+            if not is_detected[index]:
+                kps = detections[index - 1][1]
+                new_bbox = None
+                if prev_bbox is not None:
+                    new_bbox, new_kps, _ = self._propagate(prev_gray, gray, scale, prev_bbox, kps)
+                if new_bbox is None:
+                    # lost the track, or no face to follow (then a face is unlikely to show up in the next frame
+                    # either): detect this frame and the following not yet detected ones as one batch
+                    if prev_bbox is None:
+                        num_lookahead = self.batch_size
+                    chunk = [i for i in range(index, num_frames) if not is_detected[i]][:num_lookahead]
+                    for i, detection in zip(chunk, self._detect([frames[i] for i in chunk])):
+                        detections[i] = detection
+                        is_detected[i] = True
+                    num_lookahead = min(self.batch_size, 2 * num_lookahead)
+                else:
+                    height, width = frames[index].shape[:2]
+                    x1, y1, x2, y2 = new_bbox
+                    clipped = [int(max(0, x1)), int(max(0, y1)), int(min(width, x2)), int(min(height, y2))]
+                    detections[index] = (clipped, new_kps.astype(np.float32))
+                    prev_bbox = new_bbox
+                    num_lookahead = 1
+            if is_detected[index]:
+                prev_bbox = detections[index][0]
+            prev_gray = gray
+        return detections, is_detected
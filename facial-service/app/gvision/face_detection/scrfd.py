@@ -13,6 +13,8 @@ import os
 import os.path as osp
 import cv2
 import sys
+import threading
+from app.gvision.num_threads import session_options
 
 def softmax(z):
     assert len(z.shape) == 2
@@ -47,27 +49,22 @@ def distance2bbox(points, distance, max_shape=None):
     return np.stack([x1, y1, x2, y2], axis=-1)
 
 def distance2kps(points, distance, max_shape=None):
-    """Decode distance prediction to bounding box.
+    """Decode distance prediction to keypoints.
 
     Args:
-        points (Tensor): Shape (n, 2), [x, y].
-        distance (Tensor): Distance from the given point to 4
-            boundaries (left, top, right, bottom).
+        points (ndarray): Shape (n, 2), [x, y].
+        distance (ndarray): Shape (n, 2k), offsets of the k keypoints
+            from the given point, interleaved [x0, y0, x1, y1, ...].
         max_shape (tuple): Shape of the image.
 
     Returns:
-        Tensor: Decoded bboxes.
+        ndarray: Decoded keypoints, shape (n, 2k).
     """
-    preds = []
-    for i in range(0, distance.shape[1], 2):
-        px = points[:, i%2] + distance[:, i]
-        py = points[:, i%2+1] + distance[:, i+1]
-        if max_shape is not None:
-            px = px.clamp(min=0, max=max_shape[1])
-            py = py.clamp(min=0, max=max_shape[0])
-        preds.append(px)
-        preds.append(py)
-    return np.stack(preds, axis=-1)
+    preds = distance.reshape((distance.shape[0], -1, 2)) + points[:, np.newaxis, :]
+    if max_shape is not None:
+        preds[..., 0] = np.clip(preds[..., 0], 0, max_shape[1])
+        preds[..., 1] = np.clip(preds[..., 1], 0, max_shape[0])
+    return preds.reshape((distance.shape[0], -1))
 
 class SCRFD:
     def __init__(self, model_file=None, session=None, useGpu=False, index_gpu=0):
@@ -97,9 +94,11 @@ class SCRFD:
                     'CPUExecutionProvider',
                 ]
 
-            self.session = onnxruntime.InferenceSession(self.model_file, providers=providers)
+            self.session = onnxruntime.InferenceSession(self.model_file, sess_options=session_options(), providers=providers)
         self.center_cache = {}
         self.nms_thresh = 0.4
+        # letterbox canvas reused across calls, one per serving thread
+        self._local = threading.local()
         self._init_vars()
 
     def _init_vars(self):
@@ -152,81 +151,56 @@ class SCRFD:
             else:
                 self.input_size = input_size
 
-    def forward(self, img, thresh):
+    def _anchor_centers(self, height, width, stride):
+        key = (height, width, stride)
+        if key in self.center_cache:
+            return self.center_cache[key]
+        anchor_centers = np.stack(np.mgrid[:height, :width][::-1], axis=-1).astype(np.float32)
+        anchor_centers = (anchor_centers * stride).reshape( (-1, 2) )
+        if self._num_anchors>1:
+            anchor_centers = np.stack([anchor_centers]*self._num_anchors, axis=1).reshape( (-1,2) )
+        if len(self.center_cache)<100:
+            self.center_cache[key] = anchor_centers
+        return anchor_centers
+
+    def _decode(self, net_outs, batch_index, input_height, input_width, thresh):
+        """Decode the outputs of one image, only the anchors scoring >= thresh are decoded."""
         scores_list = []
         bboxes_list = []
         kpss_list = []
-        input_size = tuple(img.shape[0:2][::-1])
-        blob = cv2.dnn.blobFromImage(img, 1.0/128, input_size, (127.5, 127.5, 127.5), swapRB=True)
-        net_outs = self.session.run(self.output_names, {self.input_name : blob})
-
-        input_height = blob.shape[2]
-        input_width = blob.shape[3]
         fmc = self.fmc
         for idx, stride in enumerate(self._feat_stride_fpn):
-            # If model support batch dim, take first output
+            # If model support batch dim, take the output of this image
             if self.batched:
-                scores = net_outs[idx][0]
-                bbox_preds = net_outs[idx + fmc][0]
-                bbox_preds = bbox_preds * stride
+                scores = net_outs[idx][batch_index]
+                bbox_preds = net_outs[idx + fmc][batch_index]
                 if self.use_kps:
-                    kps_preds = net_outs[idx + fmc * 2][0] * stride
+                    kps_preds = net_outs[idx + fmc * 2][batch_index]
             # If model doesn't support batching take output as is
             else:
                 scores = net_outs[idx]
                 bbox_preds = net_outs[idx + fmc]
-                bbox_preds = bbox_preds * stride
                 if self.use_kps:
-                    kps_preds = net_outs[idx + fmc * 2] * stride
-
-            height = input_height // stride
-            width = input_width // stride
-            K = height * width
-            key = (height, width, stride)
-            if key in self.center_cache:
-                anchor_centers = self.center_cache[key]
-            else:
-                #solution-1, c style:
-                #anchor_centers = np.zeros( (height, width, 2), dtype=np.float32 )
-                #for i in range(height):
-                #    anchor_centers[i, :, 1] = i
-                #for i in range(width):
-                #    anchor_centers[:, i, 0] = i
-
-                #solution-2:
-                #ax = np.arange(width, dtype=np.float32)
-                #ay = np.arange(height, dtype=np.float32)
-                #xv, yv = np.meshgrid(np.arange(width), np.arange(height))
-                #anchor_centers = np.stack([xv, yv], axis=-1).astype(np.float32)
-
-                #solution-3:
-                anchor_centers = np.stack(np.mgrid[:height, :width][::-1], axis=-1).astype(np.float32)
-                #print(anchor_centers.shape)
-
-                anchor_centers = (anchor_centers * stride).reshape( (-1, 2) )
-                if self._num_anchors>1:
-                    anchor_centers = np.stack([anchor_centers]*self._num_anchors, axis=1).reshape( (-1,2) )
-                if len(self.center_cache)<100:
-                    self.center_cache[key] = anchor_centers
+                    kps_preds = net_outs[idx + fmc * 2]
 
             pos_inds = np.where(scores>=thresh)[0]
-            bboxes = distance2bbox(anchor_centers, bbox_preds)
-            pos_scores = scores[pos_inds]
-            pos_bboxes = bboxes[pos_inds]
-            scores_list.append(pos_scores)
-            bboxes_list.append(pos_bboxes)
+            if len(pos_inds) == 0:
+                continue
+            anchor_centers = self._anchor_centers(input_height // stride, input_width // stride, stride)[pos_inds]
+            scores_list.append(scores[pos_inds])
+            bboxes_list.append(distance2bbox(anchor_centers, bbox_preds[pos_inds] * stride))
             if self.use_kps:
-                kpss = distance2kps(anchor_centers, kps_preds)
-                #kpss = kps_preds
-                kpss = kpss.reshape( (kpss.shape[0], -1, 2) )
-                pos_kpss = kpss[pos_inds]
-                kpss_list.append(pos_kpss)
+                kpss_list.append(distance2kps(anchor_centers, kps_preds[pos_inds] * stride))
         return scores_list, bboxes_list, kpss_list
 
-    def detect(self, img, thresh=0.5, input_size = None, max_num=0, metric='default'):
-        assert input_size is not None or self.input_size is not None
-        input_size = self.input_size if input_size is None else input_size
-            
+    def forward(self, img, thresh):
+        input_size = tuple(img.shape[0:2][::-1])
+        blob = cv2.dnn.blobFromImage(img, 1.0/128, input_size, (127.5, 127.5, 127.5), swapRB=True)
+        net_outs = self.session.run(self.output_names, {self.input_name : blob})
+        return self._decode(net_outs, 0, blob.shape[2], blob.shape[3], thresh)
+
+    @staticmethod
+    def _letterbox_size(img, input_size):
         im_ratio = float(img.shape[0]) / img.shape[1]
         model_ratio = float(input_size[1]) / input_size[0]
         if im_ratio>model_ratio:
@@ -236,31 +210,81 @@ class SCRFD:
             new_width = input_size[0]
             new_height = int(new_width * im_ratio)
         det_scale = float(new_height) / img.shape[0]
-        resized_img = cv2.resize(img, (new_width, new_height))
-        det_img = np.zeros( (input_size[1], input_size[0], 3), dtype=np.uint8 )
-        det_img[:new_height, :new_width, :] = resized_img
+        return new_width, new_height, det_scale
+
+    def _letterbox(self, img, input_size, det_img):
+        """Resize img into the top-left corner of det_img and zero the rest, returns the scale."""
+        new_width, new_height, det_scale = self._letterbox_size(img, input_size)
+        det_img[:new_height, :new_width, :] = cv2.resize(img, (new_width, new_height))
+        det_img[new_height:, :, :] = 0
+        det_img[:new_height, new_width:, :] = 0
+        return det_scale
+
+    def _get_canvas(self, input_size):
+        canvas = getattr(self._local, 'det_img', None)
+        if canvas is None or canvas.shape[:2] != (input_size[1], input_size[0]):
+            canvas = np.zeros( (input_size[1], input_size[0], 3), dtype=np.uint8 )
+            self._local.det_img = canvas
+        return canvas
+
+    def detect(self, img, thresh=0.5, input_size = None, max_num=0, metric='default'):
+        assert input_size is not None or self.input_size is not None
+        input_size = self.input_size if input_size is None else input_size
+
+        det_img = self._get_canvas(input_size)
+        det_scale = self._letterbox(img, input_size, det_img)
 
         scores_list, bboxes_list, kpss_list = self.forward(det_img, thresh)
+        return self._postprocess(img.shape, det_scale, scores_list, bboxes_list, kpss_list, max_num, metric)
 
-        scores = np.vstack(scores_list)
-        scores_ravel = scores.ravel()
-        order = scores_ravel.argsort()[::-1]
-        bboxes = np.vstack(bboxes_list) / det_scale
-        if self.use_kps:
-            kpss = np.vstack(kpss_list) / det_scale
+    def detect_batch(self, imgs, thresh=0.5, input_size = None, max_num=0, metric='default'):
+        """
+        Detect faces on several images with one session run (falls back to one run per image
+        when the model has no batch dimension or a fixed batch size).
+
+        Returns:
+            list: (det, kpss) per image, as returned by detect.
+        """
+        assert input_size is not None or self.input_size is not None
+        input_size = self.input_size if input_size is None else input_size
+        batch_size = self.session.get_inputs()[0].shape[0]
+        if not self.batched or (isinstance(batch_size, int) and batch_size != len(imgs)):
+            return [self.detect(img, thresh, input_size, max_num, metric) for img in imgs]
+        if len(imgs) == 0:
+            return []
+
+        det_imgs = np.empty( (len(imgs), input_size[1], input_size[0], 3), dtype=np.uint8 )
+        det_scales = [self._letterbox(img, input_size, det_img) for img, det_img in zip(imgs, det_imgs)]
+        blob = cv2.dnn.blobFromImages(det_imgs, 1.0/128, input_size, (127.5, 127.5, 127.5), swapRB=True)
+        net_outs = self.session.run(self.output_names, {self.input_name : blob})
+
+        results = []
+        for batch_index, (img, det_scale) in enumerate(zip(imgs, det_scales)):
+            scores_list, bboxes_list, kpss_list = self._decode(net_outs, batch_index, blob.shape[2], blob.shape[3], thresh)
+            results.append(self._postprocess(img.shape, det_scale, scores_list, bboxes_list, kpss_list, max_num, metric))
+        return results
+
+    def _postprocess(self, img_shape, det_scale, scores_list, bboxes_list, kpss_list, max_num=0, metric='default'):
+        if len(scores_list) == 0:
+            det = np.zeros( (0, 5), dtype=np.float32 )
+            kpss = np.zeros( (0, 5, 2), dtype=np.float32 ) if self.use_kps else None
+            return det, kpss
+
+        scores = np.concatenate(scores_list)
+        bboxes = np.concatenate(bboxes_list) / det_scale
         pre_det = np.hstack((bboxes, scores)).astype(np.float32, copy=False)
-        pre_det = pre_det[order, :]
+        # nms returns the kept rows in descending score order, one gather for boxes and keypoints
         keep = self.nms(pre_det)
         det = pre_det[keep, :]
         if self.use_kps:
-            kpss = kpss[order,:,:]
-            kpss = kpss[keep,:,:]
+            kpss = np.concatenate(kpss_list)[keep] / det_scale
+            kpss = kpss.reshape( (kpss.shape[0], -1, 2) )
         else:
             kpss = None
         if max_num > 0 and det.shape[0] > max_num:
             area = (det[:, 2] - det[:, 0]) * (det[:, 3] -
                                                     det[:, 1])
-            img_center = img.shape[0] // 2, img.shape[1] // 2
+            img_center = img_shape[0] // 2, img_shape[1] // 2
             offsets = np.vstack([
                 (det[:, 0] + det[:, 2]) / 2 - img_center[1],
                 (det[:, 1] + det[:, 3]) / 2 - img_center[0]
@@ -279,34 +303,17 @@ class SCRFD:
         return det, kpss
 
     def nms(self, dets):
-        thresh = self.nms_thresh
-        x1 = dets[:, 0]
-        y1 = dets[:, 1]
-        x2 = dets[:, 2]
-        y2 = dets[:, 3]
-        scores = dets[:, 4]
-
-        areas = (x2 - x1 + 1) * (y2 - y1 + 1)
-        order = scores.argsort()[::-1]
-
-        keep = []
-        while order.size > 0:
-            i = order[0]
-            keep.append(i)
-            xx1 = np.maximum(x1[i], x1[order[1:]])
-            yy1 = np.maximum(y1[i], y1[order[1:]])
-            xx2 = np.minimum(x2[i], x2[order[1:]])
-            yy2 = np.minimum(y2[i], y2[order[1:]])
-
-            w = np.maximum(0.0, xx2 - xx1 + 1)
-            h = np.maximum(0.0, yy2 - yy1 + 1)
-            inter = w * h
-            ovr = inter / (areas[i] + areas[order[1:]] - inter)
-
-            inds = np.where(ovr <= thresh)[0]
-            order = order[inds + 1]
-
-        return keep
+        """
+        Greedy NMS in descending score order, returns the indices of the kept rows.
+        Widths/heights carry the +1 of the pixel-inclusive convention so the IoU is the same as the
+        reference implementation; boxes overlapping a kept box by more than nms_thresh are dropped.
+        """
+        if dets.shape[0] == 0:
+            return np.zeros( (0,), dtype=np.int64 )
+        boxes = np.stack([dets[:, 0], dets[:, 1],
+                          dets[:, 2] - dets[:, 0] + 1, dets[:, 3] - dets[:, 1] + 1], axis=1).astype(np.float64)
+        keep = cv2.dnn.NMSBoxes(boxes.tolist(), dets[:, 4].astype(np.float64).tolist(), 0.0, self.nms_thresh)
+        return np.asarray(keep, dtype=np.int64).reshape(-1)
 
 def get_scrfd(name, download=False, root='~/.insightface/models', **kwargs):
     if not download:
@@ -323,14 +330,104 @@ def scrfd_2p5gkps(**kwargs):
 
 
 class FaceDetector:
-    def __init__(self, model_path='./SCRFD_10G_KPS.onnx', threshold=0.45, useGpu=False, index_gpu=0):
+    """
+    SCRFD wrapper returning (status, bboxes, kpss).
+
+    In adaptive mode the image is first detected at small_input_size and only re-detected at
+    input_size when no face clears the threshold or the largest face covers fewer than min_size_face
+    detector pixels at the small tier (its side times the letterbox scale of the image, whatever the image
+    resolution; in an input_size-pixel image that is a min_size_face * input_size / small_input_size pixel face).
+    Callers that use every face (all_faces=True) escalate as soon as any detected face is below
+    that size, since its box and keypoints come from too few detector pixels at the small tier.
+    """
+    def __init__(self, model_path='./SCRFD_10G_KPS.onnx', threshold=0.45, useGpu=False, index_gpu=0,
+                 input_size=640, adaptive=False, small_input_size=320, min_size_face=40):
         self.detector = SCRFD(model_file=model_path, useGpu=useGpu, index_gpu=index_gpu)
         self.detector.prepare(-1)
         self.threshold = threshold
-        print('>>>> INIT FACE DETECTION MODEL - use_gpu={0}'.format(useGpu))
-    
-    def __call__(self, img):
-        bboxes, kpss = self.detector.detect(img, self.threshold, input_size = (640, 640))
+        self.input_size = input_size
+        self.small_input_size = small_input_size
+        self.adaptive = adaptive
+        if self.adaptive and self.detector.input_size is not None:
+            print('>>>> SCRFD model has a fixed input size {0}, adaptive detection disabled'.format(self.detector.input_size))
+            self.adaptive = False
+        self.min_size_face = min_size_face
+        self.tier_hits = {small_input_size: 0, input_size: 0}
+        self._stats_lock = threading.Lock()
+        print('>>>> INIT FACE DETECTION MODEL - use_gpu={0} - adaptive={1}'.format(useGpu, self.adaptive))
+
+    def _need_escalate(self, img, bboxes, all_faces=False):
+        if len(bboxes) == 0:
+            return True
+        # bboxes are in image pixels, compare the face sides in small-tier detector pixels
+        _, _, det_scale = SCRFD._letterbox_size(img, (self.small_input_size, self.small_input_size))
+        sides = np.minimum(bboxes[:, 2] - bboxes[:, 0], bboxes[:, 3] - bboxes[:, 1]) * det_scale
+        if all_faces:
+            return np.min(sides) < self.min_size_face
+        return np.max(sides) < self.min_size_face
+
+    def _count(self, input_size):
+        with self._stats_lock:
+            self.tier_hits[input_size] += 1
+
+    def stats(self):
+        """Number of requests answered by each input size and the corresponding hit rates."""
+        with self._stats_lock:
+            tier_hits = dict(self.tier_hits)
+        total = sum(tier_hits.values())
+        return {
+            "adaptive": self.adaptive,
+            "num_requests": total,
+            "tier_hits": tier_hits,
+            "tier_hit_rates": {size: (hits / total if total > 0 else 0.0) for size, hits in tier_hits.items()},
+        }
+
+    def detect(self, img, all_faces=False):
+        """Returns (bboxes, kpss, input_size used)."""
+        if self.adaptive:
+            small_size = (self.small_input_size, self.small_input_size)
+            bboxes, kpss = self.detector.detect(img, self.threshold, input_size = small_size)
+            if not self._need_escalate(img, bboxes, all_faces):
+                self._count(self.small_input_size)
+                return bboxes, kpss, self.small_input_size
+        bboxes, kpss = self.detector.detect(img, self.threshold, input_size = (self.input_size, self.input_size))
+        self._count(self.input_size)
+        return bboxes, kpss, self.input_size
+
+    @staticmethod
+    def format_result(bboxes, kpss, input_size, log=None):
+        """(bboxes, kpss, input_size) from detect -> (status, bboxes, kpss)."""
+        if log is not None:
+            log.ex_detection_input_size = input_size
         if len(bboxes) > 0 and len(kpss) > 0:
             return 1, bboxes, kpss
-        return 0, None, None
\ No newline at end of file
+        return 0, None, None
+
+    def __call__(self, img, log=None, all_faces=False):
+        return self.format_result(*self.detect(img, all_faces), log=log)
+
+    def detect_many(self, imgs, all_faces=False):
+        """Batched detect: (bboxes, kpss, input_size used) per image, all_faces is one flag or one flag per image."""
+        if isinstance(all_faces, bool):
+            all_faces = [all_faces] * len(imgs)
+        full_size = (self.input_size, self.input_size)
+        input_sizes = [self.input_size] * len(imgs)
+        if self.adaptive:
+            detections = self.detector.detect_batch(imgs, self.threshold, input_size = (self.small_input_size, self.small_input_size))
+            escalate = [i for i, ((bboxes, kpss), is_all_faces) in enumerate(zip(detections, all_faces))
+                        if self._need_escalate(imgs[i], bboxes, is_all_faces)]
+            for i in set(range(len(imgs))) - set(escalate):
+                input_sizes[i] = self.small_input_size
+                self._count(self.small_input_size)
+            if len(escalate) > 0:
+                for i, detection in zip(escalate, self.detector.detect_batch([imgs[i] for i in escalate], self.threshold, input_size = full_size)):
+                    detections[i] = detection
+                    self._count(self.input_size)
+        else:
+            detections = self.detector.detect_batch(imgs, self.threshold, input_size = full_size)
+            for _ in range(len(imgs)):
+                self._count(self.input_size)
+        return [(bboxes, kpss, input_size) for (bboxes, kpss), input_size in zip(detections, input_sizes)]
+
+    def detect_batch(self, imgs, all_faces=False):
+        return [self.format_result(*detection) for detection in self.detect_many(imgs, all_faces)]
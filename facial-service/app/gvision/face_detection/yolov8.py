@@ -1,8 +1,7 @@
 import cv2
+import threading
 import numpy as np
 from pathlib import Path
-from ultralytics import YOLO
-import torch
 
 class Face_Landmark:
     def __init__(self, model_dir: Path, device: int, image_size: int = 640, conf: float = 0.7, iou: float = 0.7) -> None:
@@ -17,7 +16,11 @@ class Face_Landmark:
         device : str
             the device name to run the model on.
         """
+        # imported here so the ONNX Runtime variant does not pull in the ultralytics/torch import tree
+        from ultralytics import YOLO
         self.model = YOLO(model_dir)
+        # the ultralytics predictor keeps per-call state, serialize calls from concurrent requests
+        self._predict_lock = threading.Lock()
         self.image_size = image_size
         self.conf = conf
         self.iou = iou
@@ -94,46 +97,84 @@ class Face_Landmark:
 
         return cropped_image
 
-    def predict(self, input_image):# pragma: no cover
+    def _infer(self, input_images):
         """
-        Get the predictions of a model on an input image.
-
-        Args:
-            model (YOLO): The trained YOLO model.
-            input_image (Image): The image on which the model will make predictions.
+        Run ultralytics on a list of images in one call.
 
         Returns:
-            pd.DataFrame: A DataFrame containing the predictions.
+            list: one (boxes_xyxy (K, 4), keypoints (K, 5, 2)) tuple of numpy arrays per image, sorted by confidence.
         """
-        try:
-            # Make predictions
+        with self._predict_lock:
             predictions = self.model.predict(
                                 imgsz=self.image_size,
-                                source=input_image,
+                                source=list(input_images),
                                 conf=self.conf,
                                 iou=self.iou,
                                 device=self.device,
                                 verbose=False
-                                )        
-            keypoints = predictions[0].to("cpu").numpy().keypoints.xy
-            list_boxes = []
-            list_kps = []
-            
-            for i, box in enumerate(predictions[0].boxes):
-                box_xyxy = [int(num) for num in box.xyxy[0]]
-                width_box = box_xyxy[2] - box_xyxy[0]
-                height_box = box_xyxy[3] - box_xyxy[1]
-                box_xyxy = [box_xyxy[0], max(0, int(box_xyxy[1] - 0.13 * height_box )), box_xyxy[2], max(0, int(box_xyxy[3] - 0.0 * height_box))]
-
-                list_kps.append(keypoints[i])
-                list_boxes.append(box_xyxy)
-            if len(list_boxes) > 0:
-                return list_boxes[0], list_kps[0]
+                                )
+        outputs = []
+        for prediction in predictions:
+            # one device -> host transfer for boxes and keypoints of the image
+            prediction = prediction.to("cpu").numpy()
+            if len(prediction.boxes) == 0:
+                outputs.append((np.zeros((0, 4), dtype=np.float32), np.zeros((0, 5, 2), dtype=np.float32)))
             else:
-                return None, None
+                outputs.append((prediction.boxes.xyxy, prediction.keypoints.xy))
+        return outputs
+
+    def _postprocess(self, boxes_xyxy, keypoints, select_largest=False):
+        boxes = boxes_xyxy.astype(np.int32)
+        # move the top edge up by 13% of the box height
+        height_box = boxes[:, 3] - boxes[:, 1]
+        boxes[:, 1] = np.maximum(0, (boxes[:, 1] - 0.13 * height_box).astype(np.int32))
+        boxes[:, 3] = np.maximum(0, boxes[:, 3])
+
+        if select_largest and len(boxes) > 1:
+            areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+            index = int(np.argmax(areas))
+            boxes, keypoints = boxes[index:index + 1], keypoints[index:index + 1]
+        return boxes, keypoints
+
+    @staticmethod
+    def first_face(boxes, keypoints):
+        if len(boxes) == 0:
+            return None, None
+        return boxes[0].tolist(), keypoints[0]
+
+    def predict(self, input_image):# pragma: no cover
+        """
+        Get the predictions of a model on an input image.
+
+        Args:
+            input_image (Image): The image on which the model will make predictions.
+
+        Returns:
+            tuple: bbox [x1, y1, x2, y2] and keypoints (5, 2) of the most confident face, (None, None) when no face is found.
+        """
+        boxes, keypoints = self.predict_batch([input_image])[0]
+        return self.first_face(boxes, keypoints)
+
+    def predict_batch(self, input_images, select_largest=False):# pragma: no cover
+        """
+        Run the detector on a list of images in a single call.
+
+        Args:
+            input_images (list): BGR images.
+            select_largest (bool): keep only the largest face of each image.
+
+        Returns:
+            list: one (boxes (K, 4) int32, keypoints (K, 5, 2)) tuple per image, sorted by confidence.
+                K is 0 when no face is found and at most 1 with select_largest.
+        """
+        if len(input_images) == 0:
+            return []
+        try:
+            return [self._postprocess(boxes_xyxy, keypoints, select_largest)
+                    for boxes_xyxy, keypoints in self._infer(input_images)]
         except:
             print(">>>>>> Predict Error .....")
-            return None, None
+            return [(np.zeros((0, 4), dtype=np.int32), np.zeros((0, 5, 2), dtype=np.float32))] * len(input_images)
 
     def _get_new_box(src_w, src_h, bbox, scale):
         x = bbox[0]
@@ -0,0 +1,129 @@
+import os
+import argparse
+import cv2
+import numpy as np
+import onnxruntime
+from pathlib import Path
+
+from app.gvision.face_detection.yolov8 import Face_Landmark
+from app.gvision.num_threads import session_options
+
+
+def export_onnx(model_dir, onnx_path=None, image_size=640):
+    """
+    Export the ultralytics YOLOv8 face-landmark checkpoint to ONNX with dynamic batch/height/width axes.
+
+    Returns:
+        str: path of the exported ONNX file.
+    """
+    from ultralytics import YOLO
+    exported_path = YOLO(model_dir).export(format='onnx', imgsz=image_size, dynamic=True)
+    if onnx_path is not None and os.path.abspath(exported_path) != os.path.abspath(onnx_path):
+        os.replace(exported_path, onnx_path)
+        exported_path = onnx_path
+    print('>>>>>>   [YOLOv8-landmark] : exported {0} -> {1}'.format(model_dir, exported_path))
+    return exported_path
+
+
+class Face_Landmark_ORT(Face_Landmark):
+    def __init__(self, model_dir: Path, device: int, image_size: int = 640, conf: float = 0.7, iou: float = 0.7, max_det: int = 300) -> None:
+        """
+        YOLOv8 face-landmark detector running the exported ONNX model in ONNX Runtime.
+        Letterbox, box/keypoint decode and NMS are done in NumPy/OpenCV, the output contract is the same as Face_Landmark.
+
+        Parameters
+        ----------
+        model_dir : Path
+            path of the exported ONNX model.
+
+        device : int
+            GPU index, negative to run on CPU.
+        """
+        if device >= 0:
+            providers = [
+                ('CUDAExecutionProvider', {
+                    'device_id': device,
+                    'arena_extend_strategy': 'kNextPowerOfTwo',
+                    'cudnn_conv_algo_search': 'EXHAUSTIVE',
+                    'do_copy_in_default_stream': True,
+                }),
+                'CPUExecutionProvider',
+            ]
+            self.device = 'cuda:{0}'.format(device)
+        else:
+            providers = [
+                'CPUExecutionProvider',
+            ]
+            self.device = 'cpu'
+
+        self.session = onnxruntime.InferenceSession(str(model_dir), sess_options=session_options(), providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.image_size = image_size
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+
+        print('>>>>>>   [YOLOv8-landmark ORT] : DEVICE_ID = {0} - model path = {1}'.format(device, model_dir))
+
+    def _letterbox(self, image):
+        # same geometry as ultralytics LetterBox(auto=False): keep ratio, pad evenly with 114
+        height, width = image.shape[:2]
+        ratio = min(self.image_size / height, self.image_size / width)
+        new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+        pad_w = (self.image_size - new_width) / 2
+        pad_h = (self.image_size - new_height) / 2
+
+        if (new_width, new_height) != (width, height):
+            image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+        top, bottom = int(round(pad_h - 0.1)), int(round(pad_h + 0.1))
+        left, right = int(round(pad_w - 0.1)), int(round(pad_w + 0.1))
+        image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        return image, ratio, left, top
+
+    def _decode(self, output, image_shape, ratio, pad_left, pad_top):
+        # output: (4 + 1 + num_kps * 3, num_anchors) -> cx, cy, w, h, score, (x, y, visibility) per keypoint
+        output = output.T
+        scores = output[:, 4]
+        output = output[scores > self.conf]
+        if len(output) == 0:
+            return np.zeros((0, 4), dtype=np.float32), np.zeros((0, 5, 2), dtype=np.float32)
+
+        scores = output[:, 4]
+        boxes_xywh = output[:, :4].copy()
+        boxes_xywh[:, 0] -= boxes_xywh[:, 2] / 2
+        boxes_xywh[:, 1] -= boxes_xywh[:, 3] / 2
+        keep = cv2.dnn.NMSBoxes(boxes_xywh.tolist(), scores.tolist(), self.conf, self.iou)
+        keep = np.array(keep, dtype=np.int64).reshape(-1)[:self.max_det]
+        # NMSBoxes returns indices by descending score
+        boxes_xywh, output = boxes_xywh[keep], output[keep]
+
+        height, width = image_shape[:2]
+        boxes = np.empty((len(keep), 4), dtype=np.float32)
+        boxes[:, 0] = (boxes_xywh[:, 0] - pad_left) / ratio
+        boxes[:, 1] = (boxes_xywh[:, 1] - pad_top) / ratio
+        boxes[:, 2] = (boxes_xywh[:, 0] + boxes_xywh[:, 2] - pad_left) / ratio
+        boxes[:, 3] = (boxes_xywh[:, 1] + boxes_xywh[:, 3] - pad_top) / ratio
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+
+        keypoints = output[:, 5:].reshape(len(keep), -1, 3)[:, :, :2].astype(np.float32)
+        keypoints[:, :, 0] = ((keypoints[:, :, 0] - pad_left) / ratio).clip(0, width)
+        keypoints[:, :, 1] = ((keypoints[:, :, 1] - pad_top) / ratio).clip(0, height)
+        return boxes, keypoints
+
+    def _infer(self, input_images):
+        letterboxed = [self._letterbox(image) for image in input_images]
+        # BGR HWC uint8 -> RGB NCHW float32 in [0, 1]
+        blob = cv2.dnn.blobFromImages([image for image, _, _, _ in letterboxed], 1.0 / 255, swapRB=True)
+        outputs = self.session.run(None, {self.input_name: blob})[0]
+        return [self._decode(output, image.shape, ratio, pad_left, pad_top)
+                for output, image, (_, ratio, pad_left, pad_top) in zip(outputs, input_images, letterboxed)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the YOLOv8 face-landmark checkpoint to ONNX')
+    parser.add_argument('--model', required=True, help='ultralytics .pt checkpoint (FACE_DETECTION_MODELPATH)')
+    parser.add_argument('--output', default=None, help='output .onnx path (FACE_DETECTION_ONNX_PATH)')
+    parser.add_argument('--image-size', type=int, default=640)
+    args = parser.parse_args()
+    export_onnx(args.model, args.output, args.image_size)
@@ -2,10 +2,24 @@
 #http://github.com/deepinsight/insightface
 # -*- coding: utf-8 -*-
 import cv2
-import torch
 import numpy as np
 import onnx
 import onnxruntime
+from app.gvision.num_threads import session_options
+
+
+INPUT_SIZE = (112, 112)
+
+
+def preprocess_faces(imgs):
+    """Aligned BGR faces -> (N, 3, 112, 112) float32 RGB blob normalized to [-1, 1], i.e. (x - 127.5) / 127.5."""
+    return cv2.dnn.blobFromImages(imgs, scalefactor=1.0 / 127.5, size=INPUT_SIZE,
+                                  mean=(127.5, 127.5, 127.5), swapRB=True, crop=False)
+
+
+def preprocess_face(img):
+    """Aligned BGR face -> (1, 3, 112, 112) float32 input normalized to [-1, 1]."""
+    return preprocess_faces([img])
 
 
 class FeatureExtractor:
@@ -32,27 +46,27 @@ class FeatureExtractor:
                 'CPUExecutionProvider',
             ]
 
-        self.ort_session = onnxruntime.InferenceSession(model_path, providers=providers)
+        self.model_path = model_path
+        self.ort_session = onnxruntime.InferenceSession(model_path, sess_options=session_options(), providers=providers)
         self.useGPU = useGpu
-        print('>>>> INIT FEATURE EXTRACTION MODEL - use_gpu={0}'.format(useGpu))
-
-    # image to tensor
-    def img2tensor(self, img):
-        img  = cv2.cvtColor(img , cv2.COLOR_BGR2RGB)
-        img = np.transpose(img, (2, 0, 1))
-        if self.useGPU:
-            img = torch.from_numpy(img).unsqueeze(0).float().cuda()
+        model_input = self.ort_session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.batch_size = model_input.shape[0] if isinstance(model_input.shape[0], int) else 0
+        print('>>>> INIT FEATURE EXTRACTION MODEL - use_gpu={0} - model={1}'.format(useGpu, model_path))
+
+    def __call__(self, imgs):
+        """
+        Embed one aligned face or a list of aligned faces in a single session run.
+
+        Returns:
+            np.ndarray: (N, 512) L2-normalized features, (1, 512) for a single face.
+        """
+        if isinstance(imgs, np.ndarray) and imgs.ndim == 3:
+            imgs = [imgs]
+        blob = preprocess_faces(imgs)
+        if self.batch_size == 1 and len(imgs) > 1:
+            # model exported with a fixed batch of 1
+            feature = np.concatenate([self.ort_session.run(None, {self.input_name: blob[i:i + 1]})[0] for i in range(len(imgs))])
         else:
-            img = torch.from_numpy(img).unsqueeze(0).float().cpu()
-        img.div_(255).sub_(0.5).div_(0.5)
-        return img
-
-    def to_numpy(self, tensor):
-        return tensor.detach().cpu().numpy() if tensor.requires_grad else tensor.cpu().numpy()
-
-    def __call__(self, img):
-        img = cv2.resize(img, (112, 112))
-        img = self.img2tensor(img)
-        ort_inputs = {self.ort_session.get_inputs()[0].name: self.to_numpy(img)}
-        feature = self.ort_session.run(None, ort_inputs)[0] # array
-        return feature / np.linalg.norm(feature)
\ No newline at end of file
+            feature = self.ort_session.run(None, {self.input_name: blob})[0]
+        return feature / np.linalg.norm(feature, axis=1, keepdims=True)
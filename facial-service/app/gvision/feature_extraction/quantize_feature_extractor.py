@@ -0,0 +1,112 @@
+"""
+INT8 (QDQ) quantization of the w600k R50 feature extractor and fp32/INT8 verification harness.
+
+Run from the facial-service root:
+
+    python -m app.gvision.feature_extraction.quantize_feature_extractor quantize \
+        --model ./app/gvision/weights/webface600_r50.onnx \
+        --output ./app/gvision/weights/webface600_r50.int8.onnx \
+        --calibration-dir <folder of aligned 112x112 face crops>
+
+    python -m app.gvision.feature_extraction.quantize_feature_extractor verify \
+        --fp32 ./app/gvision/weights/webface600_r50.onnx \
+        --int8 ./app/gvision/weights/webface600_r50.int8.onnx \
+        --images-dir <folder of aligned face crops, one sub-folder per identity> --threshold 0.5
+"""
+import os
+import json
+import argparse
+import numpy as np
+import onnx
+
+from app.gvision.quantization import load_calibration_images, ImageCalibrationReader, quantize_model
+from app.gvision.feature_extraction.face_feature_extractor import FeatureExtractor, preprocess_face
+
+
+def quantize_feature_extractor(model_path, output_path, calibration_dir, max_images=0, calibrate_method='minmax'):
+    images = load_calibration_images(calibration_dir, max_images)
+    if len(images) == 0:
+        raise ValueError("No calibration image found in {0}".format(calibration_dir))
+    input_name = onnx.load(model_path).graph.input[0].name
+    calibration_reader = ImageCalibrationReader(images, preprocess_face, input_name)
+    return quantize_model(model_path, output_path, calibration_reader, calibrate_method=calibrate_method)
+
+
+def load_identity_images(images_dir):
+    """
+    Read a verification set: either one sub-folder per identity, or a flat folder (every image its own identity).
+
+    Returns:
+        (images, labels)
+    """
+    images, labels = [], []
+    sub_dirs = sorted(name for name in os.listdir(images_dir) if os.path.isdir(os.path.join(images_dir, name)))
+    if len(sub_dirs) == 0:
+        images = load_calibration_images(images_dir)
+        return images, list(range(len(images)))
+    for label, sub_dir in enumerate(sub_dirs):
+        identity_images = load_calibration_images(os.path.join(images_dir, sub_dir))
+        images.extend(identity_images)
+        labels.extend([label] * len(identity_images))
+    return images, labels
+
+
+def verify_feature_extractor(fp32_extractor, int8_extractor, images, labels, threshold):
+    """
+    Compare fp32 and INT8 embeddings of the same crops.
+
+    Reports the cosine drift 1 - cos(fp32, int8) per crop and, over every pair of crops, how many
+    verification decisions (cosine similarity > threshold) change between the two models.
+    """
+    fp32_features = np.concatenate([fp32_extractor(images[i:i + 64]) for i in range(0, len(images), 64)])
+    int8_features = np.concatenate([int8_extractor(images[i:i + 64]) for i in range(0, len(images), 64)])
+    cosine_drift = 1.0 - np.sum(fp32_features * int8_features, axis=1)
+
+    pair_i, pair_j = np.triu_indices(len(images), k=1)
+    fp32_similarity = np.sum(fp32_features[pair_i] * fp32_features[pair_j], axis=1)
+    int8_similarity = np.sum(int8_features[pair_i] * int8_features[pair_j], axis=1)
+    fp32_match = fp32_similarity > threshold
+    int8_match = int8_similarity > threshold
+    labels = np.asarray(labels)
+    is_same = labels[pair_i] == labels[pair_j]
+    num_pairs = len(pair_i)
+
+    return {
+        "num_images": len(images),
+        "num_pairs": int(num_pairs),
+        "threshold": threshold,
+        "mean_cosine_drift": float(cosine_drift.mean()) if len(images) > 0 else 0.0,
+        "max_cosine_drift": float(cosine_drift.max()) if len(images) > 0 else 0.0,
+        "mean_abs_similarity_drift": float(np.abs(fp32_similarity - int8_similarity).mean()) if num_pairs > 0 else 0.0,
+        "num_decision_flips": int(np.sum(fp32_match != int8_match)),
+        "num_accept_to_reject": int(np.sum(fp32_match & ~int8_match)),
+        "num_reject_to_accept": int(np.sum(~fp32_match & int8_match)),
+        "fp32_accuracy": float(np.mean(fp32_match == is_same)) if num_pairs > 0 else 0.0,
+        "int8_accuracy": float(np.mean(int8_match == is_same)) if num_pairs > 0 else 0.0,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='INT8 quantization of the w600k R50 feature extractor')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    quantize_parser = subparsers.add_parser('quantize', help='build the INT8 (QDQ) model from calibration crops')
+    quantize_parser.add_argument('--model', required=True, help='fp32 .onnx (FEATURE_EXTRACTION_MODEL_PATH)')
+    quantize_parser.add_argument('--output', required=True, help='INT8 .onnx (FEATURE_EXTRACTION_INT8_MODEL_PATH)')
+    quantize_parser.add_argument('--calibration-dir', required=True, help='folder of aligned face crops')
+    quantize_parser.add_argument('--max-images', type=int, default=0)
+    quantize_parser.add_argument('--calibrate-method', default='minmax', choices=['minmax', 'percentile', 'entropy'])
+
+    verify_parser = subparsers.add_parser('verify', help='report fp32 / INT8 embedding drift')
+    verify_parser.add_argument('--fp32', required=True)
+    verify_parser.add_argument('--int8', required=True)
+    verify_parser.add_argument('--images-dir', required=True)
+    verify_parser.add_argument('--threshold', type=float, default=0.5, help='SIMILARITY_THRESHOLD')
+
+    args = parser.parse_args()
+    if args.command == 'quantize':
+        quantize_feature_extractor(args.model, args.output, args.calibration_dir, args.max_images, args.calibrate_method)
+    else:
+        images, labels = load_identity_images(args.images_dir)
+        report = verify_feature_extractor(FeatureExtractor(args.fp32), FeatureExtractor(args.int8), images, labels, args.threshold)
+        print(json.dumps(report, indent=4))
@@ -0,0 +1,29 @@
+import cv2
+
+# threads one cv2 / torch / onnxruntime call may use, 0 keeps the library defaults
+_num_threads = 0
+
+
+def set_num_threads(num_threads):
+    """
+    Limit the intra-op threads of cv2, torch and of the onnxruntime sessions created afterwards.
+
+    Every serving thread runs its own inference, so a worker uses up to (serving threads * num_threads) cores;
+    the library defaults (one thread per core each) oversubscribe the CPU as soon as two requests overlap.
+    """
+    global _num_threads
+    _num_threads = max(0, int(num_threads))
+    if _num_threads > 0:
+        import torch
+        cv2.setNumThreads(_num_threads)
+        torch.set_num_threads(_num_threads)
+
+
+def session_options():
+    """onnxruntime.SessionOptions with the thread limit of set_num_threads."""
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    if _num_threads > 0:
+        options.intra_op_num_threads = _num_threads
+        options.inter_op_num_threads = 1
+    return options
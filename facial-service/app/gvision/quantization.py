@@ -0,0 +1,122 @@
+import os
+import cv2
+import numpy as np
+try:
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+except ImportError:
+    CalibrationDataReader = object
+    quantize_static = None
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def load_calibration_images(calibration_dir, max_images=0):
+    """Read the BGR images of a calibration folder, sorted by file name (max_images = 0 reads all of them)."""
+    if not calibration_dir or not os.path.isdir(calibration_dir):
+        return []
+    file_names = sorted(name for name in os.listdir(calibration_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+    if max_images > 0:
+        file_names = file_names[:max_images]
+    images = []
+    for file_name in file_names:
+        image = cv2.imread(os.path.join(calibration_dir, file_name))
+        if image is not None:
+            images.append(image)
+    return images
+
+
+def split_calibration_images(images, holdout_fraction=0.25):
+    """
+    Deterministic calibration / held-out split (every k-th image is held out) so that the drift of the
+    INT8 model is measured on images it was not calibrated on.
+
+    Returns:
+        (calibration_images, holdout_images): the held-out list is empty when there are fewer than 2 images.
+    """
+    if len(images) < 2 or holdout_fraction <= 0:
+        return list(images), []
+    num_holdout = min(len(images) - 1, max(1, int(round(len(images) * holdout_fraction))))
+    step = len(images) / float(num_holdout)
+    holdout_indexes = set(int(i * step) for i in range(num_holdout))
+    calibration_images = [image for i, image in enumerate(images) if i not in holdout_indexes]
+    holdout_images = [image for i, image in enumerate(images) if i in holdout_indexes]
+    return calibration_images, holdout_images
+
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """
+    Feed preprocessed calibration images to onnxruntime's static quantizer, one sample per batch.
+
+    Args:
+        images (list): BGR images.
+        preprocess (callable): image -> float32 array of shape (1, C, H, W).
+        input_name (str): name of the ONNX model input.
+    """
+
+    def __init__(self, images, preprocess, input_name='input'):
+        self.images = images
+        self.preprocess = preprocess
+        self.input_name = input_name
+        self._iterator = iter(self.images)
+
+    def get_next(self):
+        image = next(self._iterator, None)
+        if image is None:
+            return None
+        return {self.input_name: self.preprocess(image)}
+
+    def rewind(self):
+        self._iterator = iter(self.images)
+
+
+def quantize_model(fp32_path, int8_path, calibration_reader=None, per_channel=True, calibrate_method='minmax'):
+    """
+    Quantize an ONNX model to INT8.
+
+    With a calibration reader the activations are quantized statically (QDQ format, ranges from
+    `calibrate_method`: minmax | percentile | entropy), without one only the weights are (dynamic quantization).
+    """
+    if quantize_static is None:
+        raise ImportError("onnxruntime is required for INT8 quantization")
+    os.makedirs(os.path.dirname(os.path.abspath(int8_path)), exist_ok=True)
+    if calibration_reader is None:
+        quantize_dynamic(fp32_path, int8_path, per_channel=per_channel, weight_type=QuantType.QInt8)
+    else:
+        quantize_static(fp32_path, int8_path, calibration_reader,
+                        quant_format=QuantFormat.QDQ,
+                        per_channel=per_channel,
+                        activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8,
+                        calibrate_method={'minmax': CalibrationMethod.MinMax,
+                                          'percentile': CalibrationMethod.Percentile,
+                                          'entropy': CalibrationMethod.Entropy}[calibrate_method])
+    print('>>>>>>   [INT8] : quantized {0} -> {1} ({2})'.format(fp32_path, int8_path,
+                                                             'dynamic' if calibration_reader is None else 'static'))
+    return int8_path
+
+
+def drift_report(fp32_scores, int8_scores, threshold, score_index=0):
+    """
+    Compare the fp32 and INT8 scores of the same samples at a decision cutoff.
+
+    Args:
+        fp32_scores, int8_scores (np.ndarray): (N, num_classes) probabilities.
+        threshold (float): cutoff applied to column `score_index`, as in the service (score > threshold).
+
+    Returns:
+        dict: mean/max absolute drift of the score and how many decisions flip at the cutoff.
+    """
+    fp32_scores = np.asarray(fp32_scores)[:, score_index]
+    int8_scores = np.asarray(int8_scores)[:, score_index]
+    drift = np.abs(fp32_scores - int8_scores)
+    flips = (fp32_scores > threshold) != (int8_scores > threshold)
+    num_samples = len(drift)
+    return {
+        "num_samples": num_samples,
+        "threshold": threshold,
+        "mean_abs_drift": float(drift.mean()) if num_samples > 0 else 0.0,
+        "max_abs_drift": float(drift.max()) if num_samples > 0 else 0.0,
+        "num_flips": int(flips.sum()),
+        "flip_rate": float(flips.mean()) if num_samples > 0 else 0.0,
+    }
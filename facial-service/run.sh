@@ -1,9 +1,10 @@
 #!/usr/bin/env bash
 
 export IS_DEBUG=${DEBUG:-false}
+# NUM_THREADS requests per worker run concurrently, each inference call uses INFERENCE_NUM_THREADS cores (env.example)
 exec gunicorn --bind 0.0.0.0:"${SERVER_PORT:-8888}" --timeout 120 \
     --workers "${NUM_WORKERS:-1}" \
     --access-logfile - \
-    --threads "${NUM_THREADS:-1}" \
+    --threads "${NUM_THREADS:-4}" \
     --error-logfile - \
     run:app
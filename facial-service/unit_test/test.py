@@ -11,7 +11,220 @@ class TestUtilMethods(unittest.TestCase):
         print('url = ', link_face_1)
         print('url = ', link_face_2)
 
-    
+
+
+def make_clip(image, num_frames, seed, max_shift=4.0, max_angle=1.5, max_zoom=0.02, noise=3.0):
+    """Synthetic hand-held clip: small random shift / rotation / zoom and sensor noise per frame."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    height, width = image.shape[:2]
+    frames = []
+    for _ in range(num_frames):
+        M = cv2.getRotationMatrix2D((width / 2, height / 2), rng.uniform(-max_angle, max_angle), 1 + rng.uniform(-max_zoom, max_zoom))
+        M[:, 2] += rng.uniform(-max_shift, max_shift, 2)
+        frame = cv2.warpAffine(image, M, (width, height), borderMode=cv2.BORDER_REFLECT).astype(np.float32)
+        frames.append(np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8))
+    return frames
+
+
+class TestSimilarityCheck(unittest.TestCase):
+    def test_ssim_matches_skimage(self):
+        from skimage.metrics import structural_similarity
+        from app.controller.facial_service.algorithm import frame_pairs_ssim, downscale_gray
+        frames = make_clip(cv2.imread('./samples/image_T1.jpg'), 6, seed=0)
+        pairs = [(0, 1), (2, 5), (4, 3)]
+        for max_side in (160, 640):
+            scores = frame_pairs_ssim(frames, pairs, max_side)
+            for (i, j), score in zip(pairs, scores):
+                first = downscale_gray(frames[i], max_side)
+                second = downscale_gray(frames[j], max_side)
+                self.assertAlmostEqual(score, structural_similarity(first, second), places=6)
+
+    def run_check(self, frames):
+        from app.controller.facial_service.algorithm import DetectSpoofVideo, VideoRequestContext
+        ctx = VideoRequestContext(frames=frames, detection_cache=None)
+        # check_similarity_images only reads the context, no model is needed
+        DetectSpoofVideo.__new__(DetectSpoofVideo).check_similarity_images(ctx)
+        return ctx
+
+    def test_live_clip_not_duplicate(self):
+        from app.constants import DUPLICATE_IMAGE
+        for seed, path in enumerate(['./samples/image_T1.jpg', './samples/image_F1.jpg', './img_test.jpg']):
+            image = cv2.imread(path)
+            ctx = self.run_check(make_clip(image, 10, seed=seed))
+            self.assertNotIn(DUPLICATE_IMAGE, ctx.similarity_images_result)
+            self.assertTrue(ctx.is_similarity_images_valid)
+            # a user holding almost still
+            ctx = self.run_check(make_clip(image, 10, seed=seed, max_shift=1.5, max_angle=0.5, max_zoom=0.005))
+            self.assertTrue(ctx.is_similarity_images_valid)
+
+    def test_still_clip_duplicate(self):
+        image = cv2.imread('./samples/image_T1.jpg')
+        frames = make_clip(image, 10, seed=2, max_shift=0, max_angle=0, max_zoom=0, noise=1.0)
+        ctx = self.run_check(frames)
+        self.assertFalse(ctx.is_similarity_images_valid)
+        # the same photo with stronger sensor noise and a fresh JPEG encoding per frame
+        frames = [cv2.imdecode(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])[1], cv2.IMREAD_COLOR)
+                  for frame in make_clip(image, 10, seed=3, max_shift=0, max_angle=0, max_zoom=0, noise=3.0)]
+        ctx = self.run_check(frames)
+        self.assertFalse(ctx.is_similarity_images_valid)
+
+    def test_scores_every_consecutive_pair(self):
+        frames = make_clip(cv2.imread('./samples/image_T1.jpg'), 8, seed=4)
+        ctx = self.run_check(frames)
+        self.assertEqual(len(ctx.similarity_images_result), len(frames) - 1)
+        # no random pair sampling: the same clip always gets the same result
+        self.assertEqual(self.run_check(frames).similarity_images_result, ctx.similarity_images_result)
+
+
+class TestVideoDecoder(unittest.TestCase):
+    def test_unknown_codec_skips_whitelist(self):
+        from app.controller.facial_service.video_decoder import VideoDecoder, VideoMetadata, VideoMetadataError, fourcc_to_codec
+        decoder = VideoDecoder(allowed_codecs=['h264'])
+        # the backend reports fourcc 0: nothing to check the whitelist against
+        codec = fourcc_to_codec(0)
+        self.assertEqual(codec, '')
+        decoder.check_metadata(VideoMetadata(codec=codec, is_codec_known=False, width=640, height=480))
+        # a codec the whitelist knows is still rejected
+        with self.assertRaises(VideoMetadataError):
+            decoder.check_metadata(VideoMetadata(codec='vp9', width=640, height=480))
+
+    def test_unmapped_fourcc_decodes(self):
+        import os
+        import tempfile
+        import numpy as np
+        from app.controller.facial_service.video_decoder import VideoDecoder
+        # MJPG is not in FOURCC_CODEC_MAP
+        video_path = os.path.join(tempfile.mkdtemp(), 'clip.avi')
+        writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+        for i in range(20):
+            writer.write(np.full((48, 64, 3), i * 10, dtype=np.uint8))
+        writer.release()
+        with open(video_path, 'rb') as f:
+            metadata, frames = VideoDecoder(allowed_codecs=['h264']).decode(f.read(), frame_skip=5)
+        os.remove(video_path)
+        self.assertFalse(metadata.is_codec_known)
+        self.assertEqual(len(frames), 4)
+
+
+class FakeSCRFD:
+    """Returns the same faces (image pixels) for every image, records the input size of each run."""
+    def __init__(self, bboxes):
+        self.bboxes = bboxes
+        self.input_sizes = []
+
+    def detect(self, img, thresh, input_size=None):
+        import numpy as np
+        self.input_sizes.append(input_size[0])
+        bboxes = np.array(self.bboxes, dtype=np.float32)
+        return bboxes, np.zeros((len(bboxes), 5, 2), dtype=np.float32)
+
+    def detect_batch(self, imgs, thresh, input_size=None):
+        return [self.detect(img, thresh, input_size) for img in imgs]
+
+
+class TestAdaptiveFaceDetection(unittest.TestCase):
+    # two faces of very different sizes: 300 x 320 and 60 x 65 pixels
+    TWO_FACES = [[100, 100, 400, 420, 0.9], [500, 50, 560, 115, 0.8]]
+
+    def make_detector(self, bboxes=TWO_FACES):
+        import threading
+        from app.gvision.face_detection.scrfd import FaceDetector
+        # same setup as FaceDetector.__init__ in adaptive mode, without loading the model
+        face_detector = FaceDetector.__new__(FaceDetector)
+        face_detector.detector = FakeSCRFD(bboxes)
+        face_detector.threshold = 0.45
+        face_detector.input_size = 640
+        face_detector.small_input_size = 320
+        face_detector.adaptive = True
+        face_detector.min_size_face = 40
+        face_detector.tier_hits = {320: 0, 640: 0}
+        face_detector._stats_lock = threading.Lock()
+        return face_detector
+
+    def test_largest_face_stays_small(self):
+        face_detector = self.make_detector()
+        status, bboxes, kpss = face_detector(cv2.imread('./samples/image_T1.jpg'))
+        self.assertEqual(status, 1)
+        self.assertEqual(face_detector.detector.input_sizes, [320])
+
+    def test_all_faces_escalate_on_small_face(self):
+        face_detector = self.make_detector()
+        status, bboxes, kpss = face_detector(cv2.imread('./samples/image_T1.jpg'), all_faces=True)
+        self.assertEqual(status, 1)
+        self.assertEqual(face_detector.detector.input_sizes, [320, 640])
+
+    def test_detect_many_escalates_all_faces_requests_only(self):
+        face_detector = self.make_detector()
+        img = cv2.imread('./samples/image_T1.jpg')
+        detections = face_detector.detect_many([img, img, img], [False, True, False])
+        self.assertEqual([input_size for _, _, input_size in detections], [320, 640, 320])
+        self.assertEqual(face_detector.stats()["tier_hits"], {320: 2, 640: 1})
+
+    def test_escalation_follows_image_resolution(self):
+        # the same face covers 200 / 6 detector pixels at the small tier of a 1920 x 1080 frame: escalate
+        face_detector = self.make_detector([[400, 400, 600, 620, 0.9]])
+        face_detector(cv2.imread('./unit_test/img.jpeg'))
+        self.assertEqual(face_detector.detector.input_sizes, [320, 640])
+        # and 200 / 2 detector pixels in a 640 x 480 frame: keep the small tier
+        face_detector = self.make_detector([[100, 100, 300, 320, 0.9]])
+        face_detector(cv2.imread('./samples/image_T1.jpg'))
+        self.assertEqual(face_detector.detector.input_sizes, [320])
+        # a 70 pixel face of a 320 x 240 frame is not downscaled at the small tier: keep it
+        face_detector = self.make_detector([[100, 100, 170, 175, 0.9]])
+        face_detector(cv2.resize(cv2.imread('./samples/image_T1.jpg'), (240, 320)))
+        self.assertEqual(face_detector.detector.input_sizes, [320])
+
+
+class TestFaceAlign(unittest.TestCase):
+    def estimate_skimage(self, src, dst):
+        from skimage.transform import SimilarityTransform
+        tform = SimilarityTransform()
+        is_success = tform.estimate(src, dst)
+        return is_success, tform.params[0:2, :]
+
+    def test_umeyama_matches_skimage(self):
+        import numpy as np
+        from app.gvision.face_detection.face_align import umeyama, get_templates
+        rng = np.random.default_rng(0)
+        template = get_templates()[0]
+        line = np.stack([np.linspace(10, 50, 5), np.linspace(20, 40, 5)], axis=1)
+        point_sets = {
+            "random": rng.uniform(0, 200, (5, 2)),
+            "collinear": line,
+            "collinear reversed": line[::-1].copy(),
+            "collinear vertical": np.stack([np.full(5, 30.0), np.linspace(10, 90, 5)], axis=1),
+        }
+        for name, lmk in point_sets.items():
+            for dst in (template, line):
+                is_success, expected = self.estimate_skimage(lmk, dst)
+                self.assertTrue(is_success, name)
+                np.testing.assert_allclose(umeyama(lmk, dst), expected, atol=1e-8, err_msg=name)
+        # batched: the same fits in one call
+        lmks = np.stack(list(point_sets.values()))
+        expected = np.stack([self.estimate_skimage(lmk, template)[1] for lmk in lmks])
+        np.testing.assert_allclose(umeyama(lmks, template[np.newaxis]), expected, atol=1e-8)
+
+    def test_umeyama_coincident_points_fail(self):
+        import numpy as np
+        from app.gvision.face_detection.face_align import umeyama, get_templates
+        lmk = np.full((5, 2), 40.0)
+        is_success, expected = self.estimate_skimage(lmk, get_templates()[0])
+        self.assertFalse(is_success)
+        self.assertTrue(np.all(np.isnan(expected)))
+        self.assertTrue(np.all(np.isnan(umeyama(lmk, get_templates()[0]))))
+
+    def test_norm_crop_coincident_landmarks_raise(self):
+        import numpy as np
+        from app.gvision.face_detection import face_align
+        img = cv2.imread('./samples/image_T1.jpg')
+        with self.assertRaises(ValueError):
+            face_align.norm_crop(img, np.full((5, 2), 40.0, dtype=np.float32))
+        with self.assertRaises(ValueError):
+            face_align.norm_crop_batch(img, np.stack([face_align.get_templates()[0], np.full((5, 2), 40.0)]))
+
+
+
 if __name__ == '__main__':
     cov = coverage.Coverage()
     cov.start()